@@ -5,36 +5,517 @@ Provides endpoints for:
 - managing conversations and messages.
 - streaming LLM responses via Server-Sent Events (SSE).
 - database connection pooling and CORS preflight handling.
+
+Two entrypoints are exposed:
+- `APP`: the plain Flask (WSGI) app, used by `python backend.py` in development.
+- `ASGI_APP`: serves /stream natively on an asyncio event loop with the async
+  OpenAI/Anthropic clients and hands every other route to `APP`. Run it with
+  `gunicorn -k uvicorn_worker.UvicornWorker backend.backend:ASGI_APP` so one worker can
+  hold many concurrent SSE connections.
 """
 
+import asyncio
+import base64
+import binascii
+import bisect
+import collections
+import concurrent.futures
+import contextlib
 import datetime as dt
 from datetime import datetime
 import dotenv
 import functools
+import gzip
+import hashlib
+import hmac
+import html
 import json
+import math
+import mimetypes
 import pathlib
 import os
+import queue
+import random
+import re
 from os import environ
+import sys
+import threading
+import time
+import typing
+import urllib.parse
+import uuid
 
+import a2wsgi
 import anthropic
 import bcrypt
 import flask
 from flask import request as flask_request
 from flask.wrappers import Response as flaskResponse
 import flask_cors
+import httpx
 import jwt
 import openai
 import psycopg2.extensions, psycopg2.extras, psycopg2.pool
+from werkzeug.datastructures import MultiDict
 
 dotenv.load_dotenv()
 
+
+## In-process metrics, exposed in the Prometheus text format at /metrics.
+METRICS: list["_Metric"] = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    """A named metric with fixed label names; label values are passed as a tuple."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {value}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram. `observe` is a lock, a bisect and three additions,
+    cheap enough to call once per stream or query; per-token work is counted
+    locally and observed once at the end.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: tuple[float, ...],
+        labels: tuple[str, ...] = (),
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            series = [
+                (labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()
+            ]
+        lines = []
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                bucket_labels = _format_labels(self.labels, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labels, labels)} {total}"
+            )
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labels, labels)} {count}"
+            )
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """A gauge or counter read at scrape time from `collect()`: {label values: value}."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: typing.Callable[[], dict[tuple, float]],
+        labels: tuple[str, ...] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in METRICS:
+        try:
+            samples = metric.samples()
+        except Exception as e:
+            print(f"Error collecting metric {metric.name}: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STREAM_TTFT_SECONDS = Histogram(
+    "gptree_stream_ttft_seconds",
+    "Time from sending a provider request to its first token.",
+    (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+    ("model",),
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "gptree_stream_tokens_per_second",
+    "Estimated output tokens per second after the first token, per reply.",
+    (5, 10, 20, 40, 80, 160, 320, 640),
+    ("model",),
+)
+STREAM_DURATION_SECONDS = Histogram(
+    "gptree_stream_duration_seconds",
+    "Duration of a reply from start to its last token, by how it ended.",
+    (0.5, 1, 2, 5, 10, 20, 40, 80, 160, 320),
+    ("model", "outcome"),
+)
+PROVIDER_ERRORS = Counter(
+    "gptree_provider_errors_total",
+    "Failed provider attempts, including ones that were retried or failed over.",
+    ("model",),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "gptree_http_request_duration_seconds",
+    "Flask request latency by route; for /stream, until the response starts.",
+    _LATENCY_BUCKETS,
+    ("method", "route", "status"),
+)
+DB_QUERY_SECONDS = Histogram(
+    "gptree_db_query_duration_seconds",
+    "Database statement latency by statement kind and main table.",
+    _LATENCY_BUCKETS,
+    ("query",),
+)
+DB_QUERY_ERRORS = Counter(
+    "gptree_db_query_errors_total",
+    "Database statements that raised, by statement kind and main table.",
+    ("query",),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "gptree_db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection at checkout.",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10),
+)
+
+_QUERY_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([a-z_][a-z0-9_]*)", re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def _query_label(prefix: str) -> str:
+    """Low-cardinality label for a statement, e.g. "select messages"."""
+    words = prefix.split(None, 1)
+    verb = words[0].lower() if words else "unknown"
+    match = _QUERY_TABLE_PATTERN.search(prefix)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+class _TimedCursorMixin:
+    """Times every execute() into DB_QUERY_SECONDS (execute_values included)."""
+
+    def execute(self, query, vars=None):
+        prefix = query[:300]
+        if isinstance(prefix, bytes):
+            prefix = prefix.decode("utf-8", "replace")
+        label = (_query_label(prefix),)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            DB_QUERY_ERRORS.inc(label)
+            raise
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, label)
+
+
+@functools.cache
+def _timed_cursor_class(factory: type) -> type:
+    return type(f"Timed{factory.__name__}", (_TimedCursorMixin, factory), {})
+
+
+class _TimedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors, of whatever cursor_factory, are timed."""
+
+    def cursor(self, *args, **kwargs):
+        factory = (
+            kwargs.get("cursor_factory")
+            or self.cursor_factory
+            or psycopg2.extensions.cursor
+        )
+        kwargs["cursor_factory"] = _timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
 ## Connection pool for PostgreSQL database.
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Raised when no database connection frees up within the acquire timeout."""
+
+
+class _PoolWaiter:
+    """A thread queued in DatabasePool.getconn, woken when a connection is handed over."""
+
+    __slots__ = ("event", "conn", "released_at", "may_connect")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+        self.released_at = 0.0
+        # Set instead of `conn` when a slot frees up without a reusable connection.
+        self.may_connect = False
+
+
+class DatabasePool:
+    """
+    Thread-safe PostgreSQL connection pool with blocking, first-come-first-served
+    checkout.
+
+    - When all `maxconn` connections are checked out, `getconn` waits (up to `timeout`
+      seconds) in a FIFO queue and `putconn` hands the connection straight to the
+      longest waiting thread, instead of raising immediately.
+    - Connections that are closed, or idle for longer than `ping_after` seconds and fail
+      a `SELECT 1`, are replaced on checkout.
+    - `stats()` reports live pool usage and cumulative wait time.
+    """
+
+    def __init__(
+        self, dsn: str, minconn: int, maxconn: int, timeout: float, ping_after: float
+    ):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._lock = threading.Lock()
+        self._idle: collections.deque = collections.deque()
+        self._waiters: collections.deque[_PoolWaiter] = collections.deque()
+        # Connections that exist or are being opened, checked out or idle.
+        self._size = 0
+        self._in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.stale_replaced = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """Check out a connection, waiting up to `timeout` seconds for one to free up."""
+        start = time.monotonic()
+        conn = None
+        released_at = 0.0
+        may_connect = False
+        waiter = None
+        with self._lock:
+            self.checkouts += 1
+            if self._idle and not self._waiters:
+                # Most recently used first keeps warm connections in rotation.
+                conn, released_at = self._idle.pop()
+                self._in_use += 1
+            elif self._size < self.maxconn and not self._waiters:
+                self._size += 1
+                self._in_use += 1
+                may_connect = True
+            else:
+                # Counted as in use by whoever hands it a connection.
+                waiter = _PoolWaiter()
+                self._waiters.append(waiter)
+                self.waits += 1
+
+        if waiter is not None:
+            if not waiter.event.wait(self.timeout):
+                with self._lock:
+                    # The handoff may have raced with the timeout.
+                    if not waiter.event.is_set():
+                        self._waiters.remove(waiter)
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout}s"
+                        )
+            conn = waiter.conn
+            released_at = waiter.released_at
+            may_connect = waiter.may_connect
+            waited = time.monotonic() - start
+            with self._lock:
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            DB_POOL_WAIT_SECONDS.observe(waited)
+        else:
+            DB_POOL_WAIT_SECONDS.observe(0.0)
+
+        try:
+            if may_connect:
+                return self._connect()
+            return self._ensure_alive(conn, released_at)
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn: psycopg2.extensions.connection) -> None:
+        """Return a connection, rolling back any open transaction first."""
+        if not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                conn.close()
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.close()
+        if conn.closed:
+            self._release_slot()
+            return
+        with self._lock:
+            self._in_use -= 1
+            now = time.monotonic()
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.released_at = now
+                self._in_use += 1
+                waiter.event.set()
+            else:
+                self._idle.append((conn, now))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'min': self.minconn,
+                'max': self.maxconn,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': len(self._waiters),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'stale_replaced': self.stale_replaced,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        return psycopg2.connect(self.dsn, connection_factory=_TimedConnection)
+
+    def _ensure_alive(
+        self, conn: psycopg2.extensions.connection, released_at: float
+    ) -> psycopg2.extensions.connection:
+        """Return `conn`, or a fresh connection if it turns out to be dead."""
+        if not conn.closed and time.monotonic() - released_at < self.ping_after:
+            return conn
+        if not conn.closed:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+                return conn
+            except psycopg2.Error:
+                conn.close()
+        print("Replacing stale database connection")
+        with self._lock:
+            self.stale_replaced += 1
+        return self._connect()
+
+    def _release_slot(self) -> None:
+        """Give up a checked-out slot whose connection is gone (closed or never opened)."""
+        with self._lock:
+            self._in_use -= 1
+            if self._waiters:
+                # Let the next waiter open a replacement in this slot.
+                waiter = self._waiters.popleft()
+                waiter.may_connect = True
+                self._in_use += 1
+                waiter.event.set()
+            else:
+                self._size -= 1
+
+
 DATABASE_URL = os.getenv('DATABASE_URL')
-postgreSQL_pool = psycopg2.pool.SimpleConnectionPool(1, 20, dsn=DATABASE_URL)
+postgreSQL_pool = DatabasePool(
+    DATABASE_URL,
+    minconn=int(environ.get('DB_POOL_MIN', '1')),
+    maxconn=int(environ.get('DB_POOL_MAX', '20')),
+    timeout=float(environ.get('DB_POOL_TIMEOUT', '10')),
+    ping_after=float(environ.get('DB_POOL_PING_AFTER', '30')),
+)
+CallbackMetric(
+    "gptree_db_pool_connections",
+    "Pooled database connections by state.",
+    lambda: {
+        (state,): postgreSQL_pool.stats()[state]
+        for state in ('in_use', 'idle', 'waiting')
+    },
+    ("state",),
+)
+CallbackMetric(
+    "gptree_db_pool_timeouts_total",
+    "Checkouts that gave up waiting for a database connection.",
+    lambda: {(): postgreSQL_pool.timeouts},
+    kind="counter",
+)
 
 ROOT_DIR = pathlib.Path(__file__).resolve().parent
-APP = flask.Flask(__name__, static_folder=ROOT_DIR.parent / "dist", static_url_path="")
-flask_cors.CORS(APP)
+STATIC_DIR = ROOT_DIR.parent / "dist"
+# The Vite bundle is served by `serve_spa` through STATIC_ASSETS, not by Flask's
+# built-in static route (which would also shadow the index.html fallback).
+APP = flask.Flask(__name__, static_folder=None)
+flask_cors.CORS(APP, expose_headers=['ETag', 'X-Next-Cursor'])
 
 # JWT configuration
 JWT_SECRET_KEY = environ.get('JWT_SECRET_KEY')
@@ -44,29 +525,335 @@ JWT_ALGORITHM = 'HS256'
 if not JWT_SECRET_KEY:
     raise RuntimeError("JWT_SECRET_KEY environment variable must be set")
 
-OPENAI = openai.OpenAI()
-OPEN_AI_CHAT_COMPLETIONS_CLIENT = OPENAI.chat.completions
-
 current_filepath = pathlib.Path(__file__).resolve()
 config_filepath = current_filepath.parent.parent / "shared" / "models.json"
 MODEL_CONFIG = json.loads(config_filepath.read_text())
 
-ANTHROPIC_CLIENT = anthropic.Anthropic()
-MAX_ANTHROPIC_TOKENS = 8192
-ANTHROPIC_MODELS = set(MODEL_CONFIG["anthropic_models"])
-OPENAI_MODELS = set(MODEL_CONFIG["openai_models"])
-REASONING_MODELS = set(MODEL_CONFIG["reasoning_models"])
+# Model to fail over or hedge to when a model errors or is slow to start answering.
+FALLBACK_MODELS = MODEL_CONFIG.get("fallback_models", {})
+
+# Per-model context window and requested output tokens; unknown models fall back to
+# their provider's `default_limits`, else DEFAULT_MODEL_LIMITS.
+MODEL_LIMITS = MODEL_CONFIG["model_limits"]
+DEFAULT_MODEL_LIMITS = {"context_window": 128000, "max_output_tokens": 1024}
+# Upper bound on estimated prompt tokens sent per turn; older turns are trimmed to fit.
+CONTEXT_TOKEN_BUDGET = int(
+    environ.get('CONTEXT_TOKEN_BUDGET', MODEL_CONFIG["context_token_budget"])
+)
+# Once over budget, trim down to this fraction of it, so the kept prefix (and the
+# provider's prompt cache for it) stays the same for several turns.
+CONTEXT_TRIM_TO = float(environ.get('CONTEXT_TRIM_TO', '0.75'))
+
+
+## Password hashing with bounded concurrency.
+class PasswordHasherBusy(Exception):
+    """Raised when more password hashes are pending than the hasher will queue."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on the calling request thread, at most `workers` at a time (one per
+    core by default).
+
+    bcrypt releases the GIL while hashing, so hashes run in parallel up to that cap
+    without oversubscribing the CPU. The caller still waits for its hash, holding its
+    request thread, so a burst of logins can fill the WSGI_THREADS pool. The cap only
+    keeps them from all burning CPU at once. At most `max_pending` hashes may be
+    running or waiting; beyond that callers get PasswordHasherBusy, answered with
+    503 + Retry-After, which bounds how many request threads logins can hold. With
+    `workers=0` there is no cap.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_pending: int):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(workers) if workers > 0 else None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(
+            bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8')
+        )
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if `hashed` was made with a different cost than `rounds`."""
+        # bcrypt hashes look like $2b$12$<salt+digest>; the third field is the cost.
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+            }
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            if self._slots is None:
+                return fn(*args)
+            with self._slots:
+                return fn(*args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+
+PASSWORD_HASHER = PasswordHasher(
+    rounds=int(environ.get('BCRYPT_ROUNDS', '12')),
+    workers=int(environ.get('BCRYPT_WORKERS', str(os.cpu_count() or 1))),
+    max_pending=int(environ.get('BCRYPT_MAX_PENDING', '8')),
+)
 
 
 # Authentication helper functions
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Hash a password using bcrypt at the configured cost (BCRYPT_ROUNDS)."""
+    return PASSWORD_HASHER.hash(password)
 
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify a password against its hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return PASSWORD_HASHER.verify(password, hashed)
+
+
+## Verified-token cache and revocation list.
+TOKEN_LIFETIME = dt.timedelta(days=7)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of decoded JWT payloads, keyed by a SHA-256 of the token.
+
+    `jwt.decode` (HMAC check plus claim validation) otherwise runs on every request,
+    including each /stream call. An entry is trusted for at most `ttl` seconds and
+    never past the token's own `exp`. Revocation is checked separately on every hit
+    (see TokenRevocationList), so cached payloads never outlive a logout.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[bytes, tuple[dict, float]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, key: bytes) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, payload: dict) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        expires_at = min(time.time() + self.ttl, float(payload.get('exp', 0)))
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: bytes) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+            }
+
+
+class TokenRevocationList:
+    """
+    In-memory copy of the `token_revocations` table, checked in O(1) per request.
+
+    A row either revokes one token (by its `jti` claim) or, with `jti` NULL, every
+    token of `user_id` issued before `revoked_at` ("log out everywhere"). A daemon
+    thread reloads the unexpired rows every `reload_interval` seconds, so a
+    revocation made by another worker takes effect within that interval; revocations
+    made by this worker apply immediately. The request path never touches the DB.
+
+    The ASGI worker loads the table at startup (`start`), before it serves requests.
+    If that load fails, or under the Flask dev server, which has no startup hook,
+    checks fail open with a logged warning until the thread's first successful load.
+    A database outage must not log every user out.
+    """
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self._jtis: frozenset[str] = frozenset()
+        self._user_cutoffs: dict[int, float] = {}
+        # Revocations made by this worker, kept until they expire (see `reload`).
+        self._local_jtis: dict[str, float] = {}
+        self._local_cutoffs: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.loaded_at: float | None = None
+        self.reload_errors = 0
+        self._warned_unloaded = False
+
+    def start(self) -> None:
+        """Load the table and start the reload thread. Blocks on the DB; never raises."""
+        if self.loaded_at is None:
+            self._try_reload()
+        self._ensure_started()
+
+    def is_revoked(self, payload: dict) -> bool:
+        self._ensure_started()
+        if self.loaded_at is None and not self._warned_unloaded:
+            self._warned_unloaded = True
+            print("Warning: token revocations not loaded yet; not checking revocations")
+        jti = payload.get('jti')
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._user_cutoffs.get(payload.get('user_id'))
+        # Tokens issued before `iat` was added count as issued at the epoch.
+        return cutoff is not None and float(payload.get('iat', 0)) < cutoff
+
+    def revoke_token(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._local_jtis[jti] = expires_at
+            self._jtis = self._jtis | {jti}
+
+    def revoke_user(self, user_id: int, cutoff: float) -> None:
+        with self._lock:
+            self._local_cutoffs[user_id] = max(
+                cutoff, self._local_cutoffs.get(user_id, 0.0)
+            )
+            cutoffs = dict(self._user_cutoffs)
+            cutoffs[user_id] = max(cutoff, cutoffs.get(user_id, 0.0))
+            self._user_cutoffs = cutoffs
+
+    def reload(self) -> None:
+        """Replace the in-memory sets with the unexpired rows from the database."""
+        conn = None
+        cur = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT jti, user_id, EXTRACT(EPOCH FROM revoked_at)
+                FROM token_revocations
+                WHERE expires_at > NOW()
+                """)
+            jtis = set()
+            cutoffs: dict[int, float] = {}
+            for jti, user_id, revoked_at in cur.fetchall():
+                if jti is not None:
+                    jtis.add(jti)
+                elif user_id is not None:
+                    cutoffs[user_id] = max(float(revoked_at), cutoffs.get(user_id, 0.0))
+            with self._lock:
+                # Keep this worker's own revocations even if the snapshot above was
+                # taken before their INSERT committed.
+                now = time.time()
+                lifetime = TOKEN_LIFETIME.total_seconds()
+                self._local_jtis = {
+                    jti: exp for jti, exp in self._local_jtis.items() if exp > now
+                }
+                self._local_cutoffs = {
+                    user_id: cutoff
+                    for user_id, cutoff in self._local_cutoffs.items()
+                    if cutoff + lifetime > now
+                }
+                jtis.update(self._local_jtis)
+                for user_id, cutoff in self._local_cutoffs.items():
+                    cutoffs[user_id] = max(cutoff, cutoffs.get(user_id, 0.0))
+                self._jtis = frozenset(jtis)
+                self._user_cutoffs = cutoffs
+                self.loaded_at = now
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                release_db_connection(conn)
+
+    def stats(self) -> dict:
+        return {
+            'revoked_tokens': len(self._jtis),
+            'revoked_users': len(self._user_cutoffs),
+            'reload_interval_seconds': self.reload_interval,
+            'loaded_at': self.loaded_at,
+            'reload_errors': self.reload_errors,
+        }
+
+    def _try_reload(self) -> None:
+        try:
+            self.reload()
+        except Exception as e:
+            self.reload_errors += 1
+            print(f"Error reloading token revocations: {e}")
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="token-revocations", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            if self.loaded_at is not None:
+                time.sleep(self.reload_interval)
+            self._try_reload()
+            if self.loaded_at is None:
+                # Not loaded yet: retry soon rather than a whole interval later.
+                time.sleep(min(self.reload_interval, 5))
+
+
+VERIFIED_TOKEN_CACHE = VerifiedTokenCache(
+    max_entries=int(environ.get('TOKEN_CACHE_MAX_ENTRIES', '10000')),
+    ttl=float(environ.get('TOKEN_CACHE_TTL', '300')),
+)
+TOKEN_REVOCATIONS = TokenRevocationList(
+    reload_interval=float(environ.get('TOKEN_REVOCATION_RELOAD_SECONDS', '30'))
+)
 
 
 def generate_token(user_id: int, email: str, is_admin: bool) -> str:
@@ -78,13 +865,19 @@ def generate_token(user_id: int, email: str, is_admin: bool) -> str:
     - They contain user info (id, email, admin status) for quick access
     - They have built-in expiration (7 days) for security
     - They can be easily verified without database lookups
+
+    `jti` identifies the token for single-session logout and `iat` (with sub-second
+    precision) lets "log out everywhere" revoke everything issued before a cutoff.
     """
+    now = datetime.now(dt.UTC)
     payload = {
         'user_id': user_id,
         'email': email,
         'is_admin': is_admin,
+        'jti': uuid.uuid4().hex,
+        'iat': now.timestamp(),
         # Token expires in 7 days
-        'exp': datetime.now(dt.UTC) + dt.timedelta(days=7),
+        'exp': now + TOKEN_LIFETIME,
     }
     return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
@@ -95,15 +888,32 @@ def verify_token(token: str) -> dict | None:
 
     This function is called on every protected route and during app startup to ensure
     tokens are still valid and haven't expired.
-    Returns None for expired or invalid tokens, triggering re-authentication.
+    Returns None for expired, invalid or revoked tokens, triggering re-authentication.
+    Decoded payloads are cached by VERIFIED_TOKEN_CACHE; revocation is checked on
+    every call against the in-memory TOKEN_REVOCATIONS.
     """
-    try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+    key = VerifiedTokenCache.key(token)
+    payload = VERIFIED_TOKEN_CACHE.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            return None
+        except jwt.InvalidTokenError:
+            return None
+        VERIFIED_TOKEN_CACHE.put(key, payload)
+
+    if TOKEN_REVOCATIONS.is_revoked(payload):
+        VERIFIED_TOKEN_CACHE.discard(key)
         return None
+    return payload
+
+
+def _extract_token(auth_header: str | None, args) -> str | None:
+    """Return the bearer token from an Authorization header or a 'token' query arg."""
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1]
+    return args.get('token')
 
 
 def require_auth(f):
@@ -124,11 +934,9 @@ def require_auth(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
         # Look for token in header first, then fallback to query string
-        auth_header = flask_request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ', 1)[1]
-        else:
-            token = flask_request.args.get('token')
+        token = _extract_token(
+            flask_request.headers.get('Authorization'), flask_request.args
+        )
         if not token:
             return flask.jsonify({'error': 'No token provided'}), 401
 
@@ -169,62 +977,955 @@ def optional_auth(f):
     return decorated_function
 
 
-def _anthropic_call(
+def require_admin(f):
+    """
+    Decorator restricting an endpoint to admin users. Apply it below @require_auth so
+    flask_request.current_user is already populated.
+    """
+
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not flask_request.current_user.get('is_admin'):
+            return flask.jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+## Provider clients, shared and per user, and cached API key lookup.
+class ProviderClientPool:
+    """
+    Provider SDK clients: one shared client per provider, plus an LRU of clients
+    for users' own API keys.
+
+    Each client owns an httpx connection pool, so TLS sessions are reused across
+    requests instead of being rebuilt. Shared clients use the provider's
+    `max_connections` from shared/models.json and are kept for the life of the
+    process. Per-user clients are capped at `per_client_connections`; at most
+    `max_connections // per_client_connections` of them are kept, and beyond that,
+    and after `idle_timeout` seconds unused, the least recently used idle ones are
+    closed. A client in use by a stream is never closed under it: the cap is soft
+    while every client is busy, and is enforced again as streams finish.
+
+    Clients are keyed by event loop as well, because an httpx pool must not be
+    shared between the ASGI loop and the background loop used by the WSGI fallback.
+    """
+
+    class _Entry:
+        __slots__ = ("client", "loop", "last_used", "active")
+
+        def __init__(self, client, loop):
+            self.client = client
+            self.loop = loop
+            self.last_used = time.monotonic()
+            self.active = 0
+
+    def __init__(
+        self, max_connections: int, per_client_connections: int, idle_timeout: float
+    ):
+        self.per_client_connections = max(1, per_client_connections)
+        self.max_clients = max(1, max_connections // self.per_client_connections)
+        self.idle_timeout = idle_timeout
+        self._entries: collections.OrderedDict[tuple, ProviderClientPool._Entry] = (
+            collections.OrderedDict()
+        )
+        self._shared: dict[tuple, typing.Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextlib.asynccontextmanager
+    async def lease(self, provider: "Provider", api_key: str | None):
+        """Yield the client for `api_key` (or the provider's shared one) for a request."""
+        loop = asyncio.get_running_loop()
+        if not api_key:
+            key = (provider.name, id(loop))
+            with self._lock:
+                client = self._shared.get(key)
+                if client is None:
+                    client = self._shared[key] = provider.new_client(
+                        provider.api_key, self._limits(provider.max_connections)
+                    )
+            yield client
+            return
+
+        key = (
+            provider.name,
+            hashlib.sha256(api_key.encode('utf-8')).digest(),
+            id(loop),
+        )
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                client = provider.new_client(
+                    api_key, self._limits(self.per_client_connections)
+                )
+                entry = self._Entry(client, loop)
+                self._entries[key] = entry
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            entry.active += 1
+            stale = self._evict_locked()
+        await self._close_all(stale)
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.active -= 1
+                entry.last_used = time.monotonic()
+                stale = self._evict_locked()
+            await self._close_all(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'shared_clients': len(self._shared),
+                'clients': len(self._entries),
+                'max_clients': self.max_clients,
+                'active_leases': sum(e.active for e in self._entries.values()),
+                'per_client_connections': self.per_client_connections,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _limits(self, connections: int) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=connections,
+            max_keepalive_connections=connections,
+            keepalive_expiry=self.idle_timeout,
+        )
+
+    def _evict_locked(self) -> list:
+        """Drop idle clients past their timeout or over the cap; caller closes them."""
+        now = time.monotonic()
+        stale = []
+        for key, entry in list(self._entries.items()):
+            if entry.active:
+                continue
+            over_cap = len(self._entries) > self.max_clients
+            if over_cap or now - entry.last_used > self.idle_timeout:
+                del self._entries[key]
+                stale.append(entry)
+            else:
+                # Entries are in LRU order, so the rest are newer and under the cap.
+                break
+        self.evictions += len(stale)
+        return stale
+
+    @staticmethod
+    async def _close_all(entries: list) -> None:
+        running = asyncio.get_running_loop()
+        for entry in entries:
+            try:
+                if entry.loop is running:
+                    await entry.client.close()
+                elif not entry.loop.is_closed():
+                    asyncio.run_coroutine_threadsafe(entry.client.close(), entry.loop)
+            except Exception as e:
+                print(f"Error closing provider client: {e}")
+
+
+class UserApiKeyCache:
+    """
+    TTL cache of each user's stored (openai_api_key, anthropic_api_key).
+
+    Saves a users query on every /stream. `update_user_keys` invalidates the entry in
+    its own process; other processes pick up a changed key within `ttl` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[int, tuple[tuple, float]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, cur, user_id: int) -> tuple[str | None, str | None]:
+        """Return the user's keys, loading them with `cur` on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        cur.execute(
+            "SELECT openai_api_key, anthropic_api_key FROM users WHERE id = %s",
+            (user_id,),
+        )
+        keys = tuple(cur.fetchone() or (None, None))
+        with self._lock:
+            self._entries[user_id] = (keys, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return keys
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+PROVIDER_CLIENTS = ProviderClientPool(
+    max_connections=int(environ.get('PROVIDER_MAX_CONNECTIONS', '200')),
+    per_client_connections=int(environ.get('PROVIDER_CLIENT_CONNECTIONS', '20')),
+    idle_timeout=float(environ.get('PROVIDER_CLIENT_IDLE_SECONDS', '300')),
+)
+USER_API_KEYS = UserApiKeyCache(
+    max_entries=int(environ.get('USER_KEY_CACHE_MAX_ENTRIES', '10000')),
+    ttl=float(environ.get('USER_KEY_CACHE_TTL', '60')),
+)
+
+
+## Anthropic prompt caching.
+ANTHROPIC_PROMPT_CACHING = environ.get('ANTHROPIC_PROMPT_CACHING', '1') != '0'
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _with_prompt_cache(
+    messages: list[dict], system_prompt: str | None
+) -> tuple[list[dict], list[dict] | None]:
+    """
+    Mark the system prompt and the conversation prefix as cacheable.
+
+    The system prompt gets its own breakpoint since it rarely changes. The second
+    sits on the newest message: it writes the whole prompt to the cache, and on the
+    next turn the same prefix (now followed by the reply and a new user turn) is read
+    back from it instead of being processed again. Prompts below the model's minimum
+    cacheable length are simply not cached by the API.
+    """
+    system = (
+        [{"type": "text", "text": system_prompt, "cache_control": _CACHE_CONTROL}]
+        if system_prompt
+        else None
+    )
+    if not messages:
+        return messages, system
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [{**content[-1], "cache_control": _CACHE_CONTROL}]
+    return messages[:-1] + [{**last, "content": content}], system
+
+
+class PromptCacheStats:
+    """
+    Per-process totals of Anthropic token usage, split into cache reads and writes.
+
+    Time to first token is summed separately for requests that read from the cache
+    and those that did not, so the latency saved by caching can be read off
+    /api/admin/stats directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.output_tokens = 0
+        self._ttft_hit = 0.0
+        self._ttft_miss = 0.0
+
+    def record(self, usage: dict, ttft: float | None) -> None:
+        read = usage.get('cache_read_input_tokens') or 0
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += usage.get('input_tokens') or 0
+            self.cache_read_input_tokens += read
+            self.cache_creation_input_tokens += (
+                usage.get('cache_creation_input_tokens') or 0
+            )
+            self.output_tokens += usage.get('output_tokens') or 0
+            if read:
+                self.cache_hits += 1
+                self._ttft_hit += ttft or 0.0
+            else:
+                self._ttft_miss += ttft or 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            misses = self.requests - self.cache_hits
+            return {
+                'enabled': ANTHROPIC_PROMPT_CACHING,
+                'requests': self.requests,
+                'cache_hits': self.cache_hits,
+                'input_tokens': self.input_tokens,
+                'cache_read_input_tokens': self.cache_read_input_tokens,
+                'cache_creation_input_tokens': self.cache_creation_input_tokens,
+                'output_tokens': self.output_tokens,
+                'avg_ttft_ms_cache_hit': (
+                    round(self._ttft_hit / self.cache_hits * 1000, 1)
+                    if self.cache_hits
+                    else None
+                ),
+                'avg_ttft_ms_cache_miss': (
+                    round(self._ttft_miss / misses * 1000, 1) if misses else None
+                ),
+            }
+
+
+PROMPT_CACHE_STATS = PromptCacheStats()
+
+
+async def _anthropic_call(
     *,
     model: str = "claude-sonnet-4-0",
     messages: list[dict],
     system_prompt: str | None,
     max_tokens: int,
     stream: bool = False,
+    client: anthropic.AsyncAnthropic,
 ):
     """
     Call the Anthropic API for chat completions with optional system prompt and
-    streaming.
+    streaming, through `client` (leased from PROVIDER_CLIENTS). Unless
+    ANTHROPIC_PROMPT_CACHING=0, the system prompt and conversation prefix are
+    marked for prompt caching (see `_with_prompt_cache`).
     """
+    system = system_prompt or None
+    if ANTHROPIC_PROMPT_CACHING:
+        messages, system = _with_prompt_cache(messages, system_prompt)
     params = {"model": model, "max_tokens": max_tokens, "messages": messages}
-    if system_prompt:
-        params["system"] = system_prompt
+    if system:
+        params["system"] = system
     if stream:
         params["stream"] = True
-    return ANTHROPIC_CLIENT.messages.create(**params)
+    return await client.messages.create(**params)
 
 
-@APP.route("/stream", methods=["GET"])
-@require_auth
-def stream_interaction() -> flaskResponse:
+## Provider registry: streaming adapters configured in shared/models.json.
+# Stored per-user keys, in the order UserApiKeyCache returns them.
+USER_KEY_COLUMNS = ("openai_api_key", "anthropic_api_key")
+
+
+class Provider:
     """
-    Stream an OpenAI or Anthropic LLM response via Server-Sent Events (SSE).
+    One entry of `providers` in shared/models.json: which models it serves, where
+    its API lives and how to authenticate. Subclasses adapt a vendor SDK's
+    streaming API to plain text deltas; which one is used is set by `adapter`.
 
-    Steps:
-    1. Create or continue a conversation record in the database.
-    2. Save user and optional system messages.
-    3. Stream tokens from the chosen LLM to the client in real time.
-    4. Persist the final assistant message after streaming completes.
-    """
-    user_text = flask_request.args.get("userText", "")
-    system_message = flask_request.args.get("systemMessage", "")
-    conversation_id_str = flask_request.args.get("conversationId")
-    llm_choice = flask_request.args.get("llm", "gpt-4.1-2025-04-14")
-    parent_message_id_str = flask_request.args.get("parentMessageId")
-    try:
-        parent_message_id = (
-            int(parent_message_id_str) if parent_message_id_str is not None else None
+    `base_url` and `api_key` can be overridden from the environment variables named
+    by `base_url_env` and `api_key_env`. `user_api_key` names the users column
+    holding a user's own key for this provider, if users may bring one.
+    """
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.label = config.get("label", name)
+        self.models = list(config.get("models", []))
+        self.base_url = (
+            environ.get(config.get("base_url_env", ""))
+            or config.get("base_url")
+            or None
         )
-    except (ValueError, TypeError):
-        parent_message_id = None
+        self.api_key = (
+            environ.get(config.get("api_key_env", "")) or config.get("api_key") or None
+        )
+        user_api_key = config.get("user_api_key")
+        self.user_key_index = (
+            USER_KEY_COLUMNS.index(user_api_key) if user_api_key else None
+        )
+        self.max_connections = int(config.get("max_connections", 100))
+        self.timeout = float(config.get("timeout", 600))
+        # Limits for this provider's models that have no `model_limits` entry.
+        self.default_limits = {
+            **DEFAULT_MODEL_LIMITS,
+            **config.get("default_limits", {}),
+        }
 
-    conn = None
-    cur = None
-    conversation_id = None
-    is_new_conversation = True
-    messages_for_llm = []
-    user_message_id = None
+    def user_key(self, api_keys: tuple[str | None, ...]) -> str | None:
+        """The user's own key for this provider, if it takes one and they set it."""
+        if self.user_key_index is None:
+            return None
+        return api_keys[self.user_key_index]
 
-    conversation_topic = _get_current_date_and_time_string()
+    def new_client(self, api_key: str | None, limits: httpx.Limits):
+        raise NotImplementedError
 
-    conn = None
-    cur = None
+    def stream(
+        self,
+        client,
+        model: str,
+        messages_for_llm: list[dict],
+        system_message: str,
+        limits: dict,
+    ) -> typing.AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class OpenAIProvider(Provider):
+    """
+    Chat Completions streaming, for OpenAI itself and for OpenAI-compatible servers
+    such as vLLM or llama.cpp. `temperature` is sent except to the provider's
+    `reasoning_models`, and `max_tokens_param` names the output limit field, since
+    older servers only accept `max_tokens`.
+    """
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        self.temperature = config.get("temperature")
+        self.reasoning_models = set(config.get("reasoning_models", []))
+        self.max_tokens_param = config.get("max_tokens_param", "max_completion_tokens")
+
+    def new_client(self, api_key: str | None, limits: httpx.Limits):
+        # SDK-level retries are off: `_model_tokens` retries with its own backoff, so
+        # every attempt is counted in MODEL_HEALTH and a failing model can be failed
+        # over quickly.
+        return openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=limits),
+        )
+
+    async def stream(self, client, model, messages_for_llm, system_message, limits):
+        openai_messages = (
+            [{"role": "system", "content": system_message}] if system_message else []
+        ) + messages_for_llm
+        params = {
+            "model": model,
+            "messages": openai_messages,
+            self.max_tokens_param: limits["max_output_tokens"],
+            "stream": True,
+        }
+        if self.temperature is not None and model not in self.reasoning_models:
+            params["temperature"] = self.temperature
+        async with await client.chat.completions.create(**params) as response:
+            async for chunk in response:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        yield choice.delta.content
+
+
+class AnthropicProvider(Provider):
+    """Messages API streaming, with prompt caching and usage recorded per request."""
+
+    def new_client(self, api_key: str | None, limits: httpx.Limits):
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits),
+        )
+
+    async def stream(self, client, model, messages_for_llm, system_message, limits):
+        anthro_messages = [m for m in messages_for_llm if m["role"] != "system"]
+        usage = {}
+        started = time.monotonic()
+        ttft = None
+        try:
+            async with await _anthropic_call(
+                model=model,
+                messages=anthro_messages,
+                system_prompt=system_message or None,
+                max_tokens=limits["max_output_tokens"],
+                stream=True,
+                client=client,
+            ) as stream:
+                async for chunk in stream:
+                    if chunk.type == "content_block_delta":
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        yield chunk.delta.text
+                    elif chunk.type == "message_start" and chunk.message.usage:
+                        usage.update(chunk.message.usage.model_dump())
+                    elif chunk.type == "message_delta" and chunk.usage:
+                        usage['output_tokens'] = chunk.usage.output_tokens
+        finally:
+            if usage:
+                PROMPT_CACHE_STATS.record(usage, ttft)
+                print(
+                    f"Anthropic usage for {model}: input "
+                    f"{usage.get('input_tokens')}, cache read "
+                    f"{usage.get('cache_read_input_tokens')}, cache write "
+                    f"{usage.get('cache_creation_input_tokens')}, output "
+                    f"{usage.get('output_tokens')}"
+                )
+
+
+PROVIDER_ADAPTERS = {"openai": OpenAIProvider, "anthropic": AnthropicProvider}
+PROVIDERS = {
+    name: PROVIDER_ADAPTERS[config["adapter"]](name, config)
+    for name, config in MODEL_CONFIG["providers"].items()
+}
+MODEL_PROVIDERS = {
+    model: provider for provider in PROVIDERS.values() for model in provider.models
+}
+# Models not listed under any provider are sent to this one.
+DEFAULT_PROVIDER = PROVIDERS[MODEL_CONFIG.get("default_provider", "openai")]
+
+
+def _provider_for(model: str) -> Provider:
+    return MODEL_PROVIDERS.get(model, DEFAULT_PROVIDER)
+
+
+## In-process cache of per-conversation message trees.
+class CachedMessage(typing.NamedTuple):
+    """One message of a cached conversation tree (a plain tuple, no per-row dict)."""
+
+    id: int
+    parent_message_id: int | None
+    sender_name: str
+    message_text: str
+    sent_at: str
+    llm_model: str | None
+    llm_provider: str | None
+    finish_reason: str | None = None
+
+
+def _cached_message(
+    id: int,
+    parent_message_id: int | None,
+    sender_name: str,
+    message_text: str,
+    sent_at: datetime,
+    llm_model: str | None,
+    llm_provider: str | None,
+    finish_reason: str | None = None,
+) -> CachedMessage:
+    """Build a CachedMessage, interning the low-cardinality string columns."""
+    return CachedMessage(
+        id,
+        parent_message_id,
+        sys.intern(sender_name),
+        message_text,
+        sent_at.isoformat(),
+        sys.intern(llm_model) if llm_model else None,
+        sys.intern(llm_provider) if llm_provider else None,
+        sys.intern(finish_reason) if finish_reason else None,
+    )
+
+
+class _TreeEntry:
+    __slots__ = ("messages", "last_id", "nbytes")
+
+    def __init__(self, messages: list[CachedMessage]):
+        self.messages = messages
+        self.last_id = max((m.id for m in messages), default=None)
+        self.nbytes = sum(_message_nbytes(m) for m in messages)
+
+
+def _message_nbytes(message: CachedMessage) -> int:
+    """Approximate memory held by a cached message: its text plus fixed overhead."""
+    return sys.getsizeof(message.message_text) + 200
+
+
+class ConversationTreeCache:
+    """
+    Bounded LRU cache of full conversation message trees, shared by /stream and
+    get_messages.
+
+    Entries are evicted least-recently-used first once either `max_entries` or
+    `max_bytes` is exceeded. Each entry remembers the highest message ID it holds;
+    readers pass in the current `max(id)` from Postgres so a tree that another worker
+    process has since written to is treated as a miss rather than served stale.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: collections.OrderedDict[int, _TreeEntry] = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, conversation_id: int) -> bool:
+        with self._lock:
+            return conversation_id in self._entries
+
+    def get(self, conversation_id: int, last_id: int | None) -> list | None:
+        """Return the cached messages if the entry is present and up to date."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None or entry.last_id != last_id:
+                if entry is not None:
+                    self._drop(conversation_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return entry.messages
+
+    def put(self, conversation_id: int, messages: list[CachedMessage]) -> None:
+        """Store a complete tree (in sent_at order) for a conversation."""
+        entry = _TreeEntry(list(messages))
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if conversation_id in self._entries:
+                self._drop(conversation_id)
+            self._entries[conversation_id] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+
+    def append(
+        self, conversation_id: int, previous_last_id: int | None, message: CachedMessage
+    ) -> None:
+        """
+        Add a newly inserted message to a cached tree in place.
+
+        `previous_last_id` is the conversation's `max(id)` just before the insert. If it
+        doesn't match the entry, some other writer got in between and the entry is
+        dropped instead.
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            if entry.last_id != previous_last_id:
+                self._drop(conversation_id)
+                return
+            entry.messages.append(message)
+            entry.last_id = message.id
+            nbytes = _message_nbytes(message)
+            entry.nbytes += nbytes
+            self._bytes += nbytes
+            self._evict()
+
+    def invalidate(self, conversation_id: int) -> None:
+        with self._lock:
+            if conversation_id in self._entries:
+                self._drop(conversation_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+            }
+
+    def _drop(self, conversation_id: int) -> None:
+        self._bytes -= self._entries.pop(conversation_id).nbytes
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+
+CONVERSATION_CACHE = ConversationTreeCache(
+    max_entries=int(environ.get('CONVERSATION_CACHE_MAX_ENTRIES', '512')),
+    max_bytes=int(environ.get('CONVERSATION_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+)
+
+
+def _branch_path(messages: list[CachedMessage], leaf_id: int) -> list[CachedMessage]:
+    """
+    Return the system messages plus the root-to-leaf path ending at `leaf_id`, in the
+    tree's sent_at order.
+    """
+    by_id = {m.id: m for m in messages}
+    path_ids = set()
+    curr = leaf_id
+    while curr is not None and curr in by_id:
+        path_ids.add(curr)
+        curr = by_id[curr].parent_message_id
+    return [m for m in messages if m.id in path_ids or m.sender_name == "system"]
+
+
+def _cached_message_from_row(row: dict) -> CachedMessage:
+    """Build a CachedMessage from a RealDictCursor row of the messages table."""
+    return _cached_message(
+        row['id'],
+        row.get('parent_message_id'),
+        row['sender_name'],
+        row['message_text'],
+        row['sent_at'],
+        row['llm_model'],
+        row['llm_provider'],
+        row.get('finish_reason'),
+    )
+
+
+def _message_json(message: CachedMessage) -> dict:
+    """Shape a message the way /api/messages returns it."""
+    return {
+        'id': message.id,
+        'text': message.message_text,
+        'sender': message.sender_name,
+        'sent_at': message.sent_at,
+        'llm_model': message.llm_model,
+        'llm_provider': message.llm_provider,
+        'finish_reason': message.finish_reason,
+        'parent_message_id': message.parent_message_id,
+    }
+
+
+def _conversation_last_message_id(cur, conversation_id: int) -> int | None:
+    """Return the highest message ID in a conversation (the cache version check)."""
+    cur.execute(
+        "SELECT max(id) FROM messages WHERE conversation_id = %s", (conversation_id,)
+    )
+    return cur.fetchone()[0]
+
+
+## Token-budgeted context assembly.
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Estimated token counts keyed by message ID; messages never change once inserted.
+_TOKEN_COUNTS: collections.OrderedDict[int, int] = collections.OrderedDict()
+_TOKEN_COUNTS_MAX = 100_000
+_TOKEN_COUNTS_LOCK = threading.Lock()
+# Rough per-message overhead for role and formatting tokens.
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheaply estimate the token count of `text` without a provider tokenizer: one token
+    per word or punctuation mark, plus one per extra 8 characters of long words.
+    """
+    return sum(1 + len(m.group()) // 8 for m in _TOKEN_PATTERN.finditer(text))
+
+
+def _message_tokens(message: dict) -> int:
+    """Estimated tokens for a history message, cached by message ID when it has one."""
+    message_id = message.get("id")
+    if message_id is None:
+        return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+    with _TOKEN_COUNTS_LOCK:
+        count = _TOKEN_COUNTS.get(message_id)
+        if count is not None:
+            _TOKEN_COUNTS.move_to_end(message_id)
+            return count
+    count = estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+    with _TOKEN_COUNTS_LOCK:
+        _TOKEN_COUNTS[message_id] = count
+        if len(_TOKEN_COUNTS) > _TOKEN_COUNTS_MAX:
+            _TOKEN_COUNTS.popitem(last=False)
+    return count
+
+
+def _provider_for_model(model: str) -> str:
+    """Return the llm_provider value stored for messages generated by `model`."""
+    return _provider_for(model).name
+
+
+def _model_limits(model: str) -> dict:
+    """
+    Return the context window and output token limits for a model: its `model_limits`
+    entry, else its provider's `default_limits`.
+    """
+    return MODEL_LIMITS.get(model) or _provider_for(model).default_limits
+
+
+def _build_context(history: list[dict], model: str, system_message: str) -> list[dict]:
+    """
+    Return the provider messages for `history`, keeping the most recent turns that fit
+    the token budget.
+
+    The budget is CONTEXT_TOKEN_BUDGET, capped by what the model's context window leaves
+    after its output tokens and the system prompt. Trimming happens in chunks: the
+    history is replayed turn by turn, and whenever it outgrows the budget the oldest
+    turns are dropped until it fits CONTEXT_TRIM_TO of the budget. The first kept turn
+    therefore only moves every few turns, and the provider's cached prefix stays valid
+    in between. The latest message is always kept, and the result always opens with a
+    user turn.
+    """
+    limits = _model_limits(model)
+    budget = min(
+        CONTEXT_TOKEN_BUDGET, limits["context_window"] - limits["max_output_tokens"]
+    )
+    if system_message:
+        budget -= estimate_tokens(system_message)
+    low_water = budget * CONTEXT_TRIM_TO
+
+    costs = [_message_tokens(message) for message in history]
+    start = 0
+    used = 0
+    for end, cost in enumerate(costs):
+        used += cost
+        if used > budget:
+            while start < end and used > low_water:
+                used -= costs[start]
+                start += 1
+    kept = history[start:]
+    while len(kept) > 1 and kept[0]["role"] != "user":
+        kept = kept[1:]
+
+    if len(kept) < len(history):
+        print(
+            f"Trimmed {len(history) - len(kept)} older messages to fit the "
+            f"{budget}-token context budget for {model}"
+        )
+    return [{"role": m["role"], "content": m["content"]} for m in kept]
+
+
+def _sse(data: dict) -> str:
+    """Format a payload as a single Server-Sent Events `data:` frame."""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+## Coalescing of provider deltas into fewer SSE token frames.
+STREAM_COALESCE_WINDOW = float(environ.get('STREAM_COALESCE_MS', '30')) / 1000
+STREAM_COALESCE_BYTES = int(environ.get('STREAM_COALESCE_BYTES', '256'))
+
+
+async def _coalesce_tokens(
+    tokens: typing.AsyncIterator[str],
+    window: float = STREAM_COALESCE_WINDOW,
+    max_bytes: int = STREAM_COALESCE_BYTES,
+) -> typing.AsyncIterator[str]:
+    """
+    Merge small provider deltas into larger chunks before they become SSE frames.
+
+    The first token is passed through at once so time-to-first-token is unchanged.
+    After that, deltas are buffered until `window` seconds have passed since the
+    buffer started filling or it holds `max_bytes` of UTF-8, whichever comes first.
+    The provider is drained by its own task into a queue, so the window is enforced
+    by a timer even while the provider is stalled, and the provider's stream is
+    entered and exited on one task. Whatever is buffered is flushed when the provider
+    finishes, and before a provider error is re-raised. A `window` of 0 disables
+    coalescing.
+    """
+    if window <= 0:
+        async for tok in tokens:
+            yield tok
+        return
+
+    done = object()
+    deltas: asyncio.Queue = asyncio.Queue()
+
+    async def _drain():
+        try:
+            async for tok in tokens:
+                deltas.put_nowait(tok)
+        except Exception as e:
+            deltas.put_nowait(e)
+        else:
+            deltas.put_nowait(done)
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(_drain())
+    buffer: list[str] = []
+    buffered_bytes = 0
+    deadline = None
+    first = True
+
+    try:
+        while True:
+            try:
+                if deadline is None:
+                    item = await deltas.get()
+                else:
+                    item = await asyncio.wait_for(
+                        deltas.get(), max(0.0, deadline - loop.time())
+                    )
+            except TimeoutError:
+                yield "".join(buffer)
+                buffer, buffered_bytes, deadline = [], 0, None
+                continue
+
+            if item is done or isinstance(item, Exception):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer = []
+                if item is done:
+                    return
+                raise item
+
+            if first:
+                first = False
+                yield item
+                continue
+
+            buffer.append(item)
+            buffered_bytes += len(item.encode("utf-8"))
+            if deadline is None:
+                deadline = loop.time() + window
+            if buffered_bytes >= max_bytes:
+                yield "".join(buffer)
+                buffer, buffered_bytes, deadline = [], 0, None
+    finally:
+        if not producer.done():
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+
+
+# Most models one /stream request may fan out to.
+MAX_STREAM_MODELS = 4
+
+
+def _parse_stream_args(args) -> dict:
+    """
+    Normalize the /stream query parameters.
+
+    `args` is either `flask_request.args` or the MultiDict built from an ASGI query
+    string, so both serving modes read the request the same way.
+    """
+    parent_message_id_str = args.get("parentMessageId")
+    try:
+        parent_message_id = (
+            int(parent_message_id_str) if parent_message_id_str is not None else None
+        )
+    except (ValueError, TypeError):
+        parent_message_id = None
+
+    # `llm` may be repeated or comma-separated to fan one turn out to several models.
+    llm_choices = []
+    for value in args.getlist("llm"):
+        for model in value.split(","):
+            model = model.strip()
+            if model and model not in llm_choices:
+                llm_choices.append(model)
+    llm_choices = llm_choices[:MAX_STREAM_MODELS] or ["gpt-4.1-2025-04-14"]
+
+    return {
+        "user_text": args.get("userText", ""),
+        "system_message": args.get("systemMessage", ""),
+        "conversation_id_str": args.get("conversationId"),
+        "llm_choices": llm_choices,
+        "parent_message_id": parent_message_id,
+    }
+
+
+def _prepare_stream(stream_args: dict, user_id: int) -> dict | None:
+    """
+    Create or continue a conversation and save the user (and optional system) message.
+
+    This is the blocking database half of a /stream request. The ASGI handler runs it
+    in a worker thread so the event loop is never blocked on Postgres.
+    Returns the context needed by `_generate_stream`, or None if preparation failed.
+    """
+    user_text = stream_args["user_text"]
+    system_message = stream_args["system_message"]
+    conversation_id_str = stream_args["conversation_id_str"]
+    parent_message_id = stream_args["parent_message_id"]
+
+    conn = None
+    cur = None
     conversation_id = None
+    is_new_conversation = True
+    messages_for_llm = []
+    user_message_id = None
+    new_cache_rows = []
+    api_keys = (None, None)
 
     try:
         conn = get_db_connection()
@@ -236,30 +1937,70 @@ def stream_interaction() -> flaskResponse:
                 is_new_conversation = False
                 print(f"Continuing conversation ID: {conversation_id}")
 
-                cur.execute(
-                    """
-                    SELECT id, parent_message_id, sender_name, message_text, sent_at
-                    FROM messages
-                    WHERE conversation_id = %s
-                    ORDER BY sent_at ASC
-                    """,
-                    (conversation_id,),
-                )
-                existing_messages = cur.fetchall()
-
-                if parent_message_id is not None:
-                    # Filter to only include the selected branch path and system messages
-                    id_map = {m[0]: m for m in existing_messages}
-                    path_ids = set()
-                    curr = parent_message_id
-                    while curr is not None and curr in id_map:
-                        path_ids.add(curr)
-                        curr = id_map[curr][1]
-                    existing_messages = [
-                        m
-                        for m in existing_messages
-                        if m[0] in path_ids or m[2] == "system"
-                    ]
+                cached_messages = None
+                if conversation_id in CONVERSATION_CACHE:
+                    cached_messages = CONVERSATION_CACHE.get(
+                        conversation_id,
+                        _conversation_last_message_id(cur, conversation_id),
+                    )
+
+                # CachedMessage rows line up with the SELECTs below:
+                # (id, parent_message_id, sender_name, message_text, sent_at, ...)
+                if cached_messages is not None:
+                    existing_messages = (
+                        _branch_path(cached_messages, parent_message_id)
+                        if parent_message_id is not None
+                        else cached_messages
+                    )
+                elif parent_message_id is not None:
+                    # Only load the selected branch path (walked up from the parent
+                    # inside Postgres) plus the conversation's system messages.
+                    cur.execute(
+                        """
+                        WITH RECURSIVE branch AS (
+                            SELECT
+                                id, parent_message_id, sender_name, message_text, sent_at
+                            FROM messages
+                            WHERE id = %s AND conversation_id = %s
+                            UNION ALL
+                            SELECT
+                                m.id,
+                                m.parent_message_id,
+                                m.sender_name,
+                                m.message_text,
+                                m.sent_at
+                            FROM messages m
+                            JOIN branch b ON m.id = b.parent_message_id
+                            WHERE m.conversation_id = %s
+                        )
+                        SELECT id, parent_message_id, sender_name, message_text, sent_at
+                        FROM branch
+                        WHERE sender_name <> 'system'
+                        UNION ALL
+                        SELECT id, parent_message_id, sender_name, message_text, sent_at
+                        FROM messages
+                        WHERE conversation_id = %s AND sender_name = 'system'
+                        ORDER BY sent_at ASC
+                        """,
+                        (
+                            parent_message_id,
+                            conversation_id,
+                            conversation_id,
+                            conversation_id,
+                        ),
+                    )
+                    existing_messages = cur.fetchall()
+                else:
+                    cur.execute(
+                        """
+                        SELECT id, parent_message_id, sender_name, message_text, sent_at
+                        FROM messages
+                        WHERE conversation_id = %s
+                        ORDER BY sent_at ASC
+                        """,
+                        (conversation_id,),
+                    )
+                    existing_messages = cur.fetchall()
 
                 for m in existing_messages:
                     sender = m[2]
@@ -267,7 +2008,9 @@ def stream_interaction() -> flaskResponse:
                     if sender == "system" and system_message == "":
                         system_message = text
                     else:
-                        messages_for_llm.append({"role": sender, "content": text})
+                        messages_for_llm.append(
+                            {"id": m[0], "role": sender, "content": text}
+                        )
 
             except (ValueError, TypeError):
                 print(
@@ -284,7 +2027,7 @@ def stream_interaction() -> flaskResponse:
             INSERT INTO conversations (conversation_topic, user_id)
             VALUES (%s, %s) RETURNING id
             """,
-                (conversation_topic, flask_request.current_user['user_id']),
+                (conversation_topic, user_id),
             )
             conversation_id_row = cur.fetchone()
             if not conversation_id_row:
@@ -298,207 +2041,2122 @@ def stream_interaction() -> flaskResponse:
                     """
                     INSERT INTO messages (conversation_id, message_text, sender_name)
                     VALUES (%s, %s, %s)
+                    RETURNING id, sent_at
                     """,
                     (conversation_id, system_message, "system"),
                 )
+                system_id, system_sent_at = cur.fetchone()
+                new_cache_rows.append(
+                    _cached_message(
+                        system_id,
+                        None,
+                        "system",
+                        system_message,
+                        system_sent_at,
+                        None,
+                        "openai",
+                    )
+                )
 
-        messages_for_llm.append({"role": "user", "content": user_text})
+        user_message = {"role": "user", "content": user_text}
+        messages_for_llm.append(user_message)
 
         cur.execute(
             """
-            INSERT INTO messages 
+            WITH previous AS (
+                SELECT max(id) AS last_id FROM messages WHERE conversation_id = %s
+            )
+            INSERT INTO messages
                 (conversation_id, message_text, sender_name, parent_message_id)
             VALUES (%s, %s, %s, %s)
-            RETURNING id
+            RETURNING id, sent_at, (SELECT last_id FROM previous)
             """,
-            (conversation_id, user_text, "user", parent_message_id),
+            (conversation_id, conversation_id, user_text, "user", parent_message_id),
         )
-        user_message_id = cur.fetchone()[0]
+        user_message_id, user_sent_at, previous_last_id = cur.fetchone()
         conn.commit()
+        user_message["id"] = user_message_id
+
+        user_row = _cached_message(
+            user_message_id,
+            parent_message_id,
+            "user",
+            user_text,
+            user_sent_at,
+            None,
+            "openai",
+        )
+        if is_new_conversation:
+            CONVERSATION_CACHE.put(conversation_id, new_cache_rows + [user_row])
+        else:
+            CONVERSATION_CACHE.append(conversation_id, previous_last_id, user_row)
+
+        api_keys = USER_API_KEYS.get(cur, user_id)
 
     except Exception as e:
         print(f"Error preparing conversation (ID: {conversation_id}): {e}")
         if conn:
             conn.rollback()
-        error_data = json.dumps({"error": "Failed to prepare conversation"})
-        return flask.Response(f"data: {error_data}\n\n", mimetype="text/event-stream")
+        return None
     finally:
         if cur:
             cur.close()
         if conn:
             release_db_connection(conn)
 
-    def generate(conv_id, chosen_llm):
-        assistant_message_accumulator = []
-        print(f"Starting generation for conversation ID: {conv_id}")
+    return {
+        "conversation_id": conversation_id,
+        "is_new_conversation": is_new_conversation,
+        "history": messages_for_llm,
+        "system_message": system_message,
+        "user_message_id": user_message_id,
+        "user_id": user_id,
+        "api_keys": api_keys,
+    }
+
 
-        if is_new_conversation:
-            new_convo_data = json.dumps({"new_conversation_id": conv_id})
-            yield f"data: {new_convo_data}\n\n"
+def _save_assistant_message(
+    conv_id: int,
+    text: str,
+    chosen_llm: str,
+    parent_message_id: int | None,
+    finish_reason: str | None = None,
+) -> int | None:
+    """
+    Persist a single finished assistant reply and return its message ID. Streams go
+    through ASSISTANT_MESSAGE_WRITER; this is its per-row fallback.
+    """
+    conn = None
+    cur = None
+    try:
+        print(f"Attempting to save final message for conv {conv_id}")
+        conn = get_db_connection()
+        cur = conn.cursor()
+        provider = _provider_for_model(chosen_llm)
+        cur.execute(
+            """
+            WITH previous AS (
+                SELECT max(id) AS last_id FROM messages WHERE conversation_id = %s
+            )
+            INSERT INTO messages (
+                conversation_id,
+                message_text,
+                sender_name,
+                llm_model,
+                llm_provider,
+                parent_message_id,
+                finish_reason
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id, sent_at, (SELECT last_id FROM previous)
+            """,
+            (
+                conv_id,
+                conv_id,
+                text,
+                "assistant",
+                chosen_llm,
+                provider,
+                parent_message_id,
+                finish_reason,
+            ),
+        )
+        assistant_msg_row = cur.fetchone()
+        conn.commit()
+        print(f"Successfully saved final message for conv {conv_id}")
+        if not assistant_msg_row:
+            return None
+        assistant_msg_id, sent_at, previous_last_id = assistant_msg_row
+        CONVERSATION_CACHE.append(
+            conv_id,
+            previous_last_id,
+            _cached_message(
+                assistant_msg_id,
+                parent_message_id,
+                "assistant",
+                text,
+                sent_at,
+                chosen_llm,
+                provider,
+                finish_reason,
+            ),
+        )
+        return assistant_msg_id
+    except Exception as e:
+        print(f"Error saving final assistant message to DB for conv {conv_id}: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
 
-        # Inform client of the user message ID for branching
-        if user_message_id is not None:
-            user_msg_data = json.dumps({"user_message_id": user_message_id})
-            yield f"data: {user_msg_data}\n\n"
 
-        model_to_use = chosen_llm
+class _PendingAssistantMessage(typing.NamedTuple):
+    conversation_id: int
+    text: str
+    llm_model: str
+    parent_message_id: int | None
+    finish_reason: str | None
+    future: concurrent.futures.Future
 
-        try:
-            if model_to_use in ANTHROPIC_MODELS:
-                anthro_messages = messages_for_llm[:]
-                anthro_messages = [m for m in messages_for_llm if m["role"] != "system"]
-                with _anthropic_call(
-                    model=model_to_use,
-                    messages=anthro_messages,
-                    system_prompt=system_message or None,
-                    max_tokens=MAX_ANTHROPIC_TOKENS,
-                    stream=True,
-                ) as stream:
-                    for chunk in stream:
-                        if chunk.type == "content_block_delta":
-                            tok = chunk.delta.text
-                            assistant_message_accumulator.append(tok)
-                            yield f"data: {json.dumps({'token': tok})}\n\n"
-            else:
-                openai_messages = (
-                    [{"role": "system", "content": system_message}]
-                    if system_message
-                    else []
-                ) + messages_for_llm
-                params = {
-                    "model": model_to_use,
-                    "messages": openai_messages,
-                    "max_completion_tokens": 1024,
-                    "stream": True,
-                }
-                if model_to_use not in REASONING_MODELS:
-                    params["temperature"] = 0.8
-                response = OPEN_AI_CHAT_COMPLETIONS_CLIENT.create(**params)
-
-                for chunk in response:
-                    if chunk.choices:
-                        choice = chunk.choices[0]
-                        if choice.delta and choice.delta.content:
-                            raw_token = choice.delta.content
-                            assistant_message_accumulator.append(raw_token)
-                            data_str = json.dumps({"token": raw_token})
-                            yield f"data: {data_str}\n\n"
 
-        except Exception as e:
-            print(f"Error during streaming from OpenAI for conv {conv_id}: {e}")
-            error_data = json.dumps({"error": "Streaming failed"})
-            yield f"data: {error_data}\n\n"
+class AssistantMessageWriter:
+    """
+    Write-behind persister that batches assistant-message inserts from concurrent
+    streams.
 
-        finally:
-            final_assistant_text = "".join(assistant_message_accumulator)
-            print(
-                f"Finished streaming for conv {conv_id}. Final text length: "
-                f"{len(final_assistant_text)}"
+    Streams `submit` their finished reply and await the returned future for the new
+    message ID. A single background thread drains whatever has queued up (up to
+    `max_batch` rows, optionally lingering `linger` seconds for more) and writes it as
+    one multi-row INSERT and one commit. Batching happens naturally under load: while
+    one batch is being written, the next one accumulates. If a batch fails, its rows are
+    retried one by one so a single bad row can't lose the others.
+    """
+
+    def __init__(self, max_batch: int, linger: float):
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue: queue.Queue[_PendingAssistantMessage] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def submit(
+        self,
+        conv_id: int,
+        text: str,
+        chosen_llm: str,
+        parent_message_id: int | None,
+        finish_reason: str | None = None,
+    ) -> concurrent.futures.Future:
+        """Queue an assistant reply; the future resolves to its message ID or None."""
+        # Started lazily so each forked gunicorn worker gets its own writer thread.
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="assistant-message-writer", daemon=True
+                )
+                self._thread.start()
+        future = concurrent.futures.Future()
+        self._queue.put(
+            _PendingAssistantMessage(
+                conv_id, text, chosen_llm, parent_message_id, finish_reason, future
             )
+        )
+        return future
 
-            if conv_id is not None and final_assistant_text:
-                conn2 = None
-                cur2 = None
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'rows': self.rows,
+            'avg_batch_size': self.rows / self.batches if self.batches else None,
+        }
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
                 try:
-                    print(f"Attempting to save final message for conv {conv_id}")
-                    conn2 = get_db_connection()
-                    cur2 = conn2.cursor()
-                    provider = (
-                        "anthropic" if chosen_llm in ANTHROPIC_MODELS else "openai"
-                    )
-                    cur2.execute(
-                        """
-                        INSERT INTO messages (
-                            conversation_id,
-                            message_text,
-                            sender_name,
-                            llm_model,
-                            llm_provider,
-                            parent_message_id
-                        )
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                        """,
-                        (
-                            conv_id,
-                            final_assistant_text,
-                            "assistant",
-                            chosen_llm,
-                            provider,
-                            user_message_id,
-                        ),
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Even the per-row fallback failed (e.g. no connection could be had).
+                # Fail whatever is still pending and keep serving later batches.
+                print(f"Error saving batch of {len(batch)} assistant messages: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+    def _write(self, batch: list[_PendingAssistantMessage]) -> None:
+        try:
+            message_ids = self._insert_batch(batch)
+        except Exception as e:
+            print(f"Error saving batch of {len(batch)} assistant messages: {e}")
+            for pending in batch:
+                pending.future.set_result(
+                    _save_assistant_message(
+                        pending.conversation_id,
+                        pending.text,
+                        pending.llm_model,
+                        pending.parent_message_id,
+                        pending.finish_reason,
                     )
-                    assistant_msg_row = cur2.fetchone()
-                    conn2.commit()
-                    if assistant_msg_row:
-                        assistant_msg_id = assistant_msg_row[0]
-                        # Inform client of the assistant message ID for branching
-                        assistant_id_data = json.dumps(
-                            {"assistant_message_id": assistant_msg_id}
-                        )
-                        yield f"data: {assistant_id_data}\n\n"
-                    print(f"Successfully saved final message for conv {conv_id}")
-                except Exception as e:
-                    print(
-                        "Error saving final assistant message to DB for conv "
-                        "{0}: {1}".format(conversation_id, e)
+                )
+            return
+        self.batches += 1
+        self.rows += len(batch)
+        for pending, message_id in zip(batch, message_ids):
+            pending.future.set_result(message_id)
+
+    def _insert_batch(self, batch: list[_PendingAssistantMessage]) -> list[int]:
+        """Insert all rows of `batch` in one transaction and return their IDs in order."""
+        conn = None
+        cur = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            # Reserve IDs up front so each row's ID is known regardless of the order
+            # RETURNING happens to produce.
+            cur.execute(
+                "SELECT nextval(pg_get_serial_sequence('messages', 'id')) "
+                "FROM generate_series(1, %s)",
+                (len(batch),),
+            )
+            message_ids = [row[0] for row in cur.fetchall()]
+            rows = psycopg2.extras.execute_values(
+                cur,
+                """
+                WITH batch (
+                    id,
+                    conversation_id,
+                    message_text,
+                    sender_name,
+                    llm_model,
+                    llm_provider,
+                    parent_message_id,
+                    finish_reason
+                ) AS (VALUES %s),
+                previous AS (
+                    SELECT conversation_id, max(id) AS last_id
+                    FROM messages
+                    WHERE conversation_id IN (SELECT conversation_id FROM batch)
+                    GROUP BY conversation_id
+                ),
+                inserted AS (
+                    INSERT INTO messages (
+                        id,
+                        conversation_id,
+                        message_text,
+                        sender_name,
+                        llm_model,
+                        llm_provider,
+                        parent_message_id,
+                        finish_reason
                     )
-                    if conn2:
-                        conn2.rollback()
-                finally:
-                    if cur2:
-                        cur2.close()
-                    if conn2:
-                        release_db_connection(conn2)
-            elif conv_id is None:
-                print("Skipping final save: conversation_id is None.")
-            else:
-                print(
-                    f"Skipping final save for conv {conv_id}: No assistant text generated."
+                    SELECT * FROM batch
+                    RETURNING id, conversation_id, sent_at
                 )
+                SELECT inserted.id, inserted.sent_at, previous.last_id
+                FROM inserted
+                LEFT JOIN previous USING (conversation_id)
+                """,
+                [
+                    (
+                        message_id,
+                        pending.conversation_id,
+                        pending.text,
+                        "assistant",
+                        pending.llm_model,
+                        _provider_for_model(pending.llm_model),
+                        pending.parent_message_id,
+                        pending.finish_reason,
+                    )
+                    for message_id, pending in zip(message_ids, batch)
+                ],
+                template="(%s::integer, %s::integer, %s, %s, %s, %s, %s::integer, %s)",
+                page_size=len(batch),
+                fetch=True,
+            )
+            conn.commit()
+        except Exception:
+            if conn:
+                conn.rollback()
+            raise
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                release_db_connection(conn)
 
-        # Send completion signal to frontend
-        completion_data = json.dumps({"stream_complete": True})
-        yield f"data: {completion_data}\n\n"
+        inserted = {row[0]: row for row in rows}
+        # Replay the inserts into the tree cache in ID order, so a conversation with
+        # several rows in this batch chains each one onto the previous.
+        last_ids = {}
+        for message_id, pending in sorted(zip(message_ids, batch), key=lambda p: p[0]):
+            _, sent_at, previous_last_id = inserted[message_id]
+            conv_id = pending.conversation_id
+            CONVERSATION_CACHE.append(
+                conv_id,
+                last_ids.get(conv_id, previous_last_id),
+                _cached_message(
+                    message_id,
+                    pending.parent_message_id,
+                    "assistant",
+                    pending.text,
+                    sent_at,
+                    pending.llm_model,
+                    _provider_for_model(pending.llm_model),
+                    pending.finish_reason,
+                ),
+            )
+            last_ids[conv_id] = message_id
+        return message_ids
 
-    return flask.Response(
-        generate(conversation_id, llm_choice), mimetype="text/event-stream"
-    )
 
+ASSISTANT_MESSAGE_WRITER = AssistantMessageWriter(
+    max_batch=int(environ.get('ASSISTANT_WRITE_MAX_BATCH', '100')),
+    linger=float(environ.get('ASSISTANT_WRITE_LINGER_MS', '0')) / 1000,
+)
 
-@APP.route("/api/conversations", methods=['GET'])
-@optional_auth
-def get_conversations() -> flaskResponse:
+
+async def _provider_tokens(
+    model_to_use: str,
+    messages_for_llm: list[dict],
+    system_message: str,
+    limits: dict,
+    api_keys: tuple[str | None, str | None] = (None, None),
+) -> typing.AsyncIterator[str]:
+    """
+    Stream the raw text deltas of one completion from the model's provider.
+
+    `api_keys` is the user's stored (openai, anthropic) pair; when the provider
+    accepts user keys and the relevant one is set, the request goes through that
+    user's pooled client instead of the provider's shared one.
+    """
+    provider = _provider_for(model_to_use)
+    async with PROVIDER_CLIENTS.lease(provider, provider.user_key(api_keys)) as client:
+        async for tok in provider.stream(
+            client, model_to_use, messages_for_llm, system_message, limits
+        ):
+            yield tok
+
+
+## Content-addressed response cache with in-flight coalescing.
+class _InFlightResponse:
+    """
+    One upstream generation shared by every identical concurrent request.
+
+    The provider stream runs in its own task, so the first requester going away
+    does not cut off the others; it is cancelled only when the last subscriber
+    leaves. Subscribers may sit on different event loops (ASGI and the WSGI
+    fallback loop), so deltas are handed to them with `call_soon_threadsafe`.
     """
-    GET /api/conversations
 
-    Return a list of all conversations with their IDs and topics.
-    If user is not authenticated, return empty list.
+    _DONE = object()
+
+    def __init__(self):
+        self.chunks: list[str] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+        self._subscribers: list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, chunk: str) -> None:
+        with self._lock:
+            self.chunks.append(chunk)
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+    def finish(self, error: BaseException | None = None) -> None:
+        with self._lock:
+            self.finished = True
+            self.error = error
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, self._DONE)
+
+    async def subscribe(self) -> typing.AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            backlog = list(self.chunks)
+            finished = self.finished
+            if not finished:
+                self._subscribers.append((loop, queue))
+        try:
+            for chunk in backlog:
+                yield chunk
+            if not finished:
+                while (item := await queue.get()) is not self._DONE:
+                    yield item
+            if self.error is not None:
+                raise self.error
+        finally:
+            with self._lock:
+                if (loop, queue) in self._subscribers:
+                    self._subscribers.remove((loop, queue))
+                abandoned = not self._subscribers and not self.finished
+            if abandoned and self.task is not None:
+                self.task.get_loop().call_soon_threadsafe(self.task.cancel)
+
+
+class ResponseCache:
+    """
+    Opt-in cache of finished assistant replies, keyed by a hash of the request.
+
+    The key covers everything that shapes the reply: model, output limit, system
+    prompt and the exact messages sent after context trimming. It also includes the
+    user, so one user's reply, or the API key that paid for it, is never served to
+    another user with the same history. Entries are evicted
+    LRU once their text exceeds `max_bytes` in total, and expire after `ttl`
+    seconds. Identical requests arriving while one is being generated attach to it
+    (see _InFlightResponse) instead of starting another upstream stream. Only
+    complete replies are cached; errors and abandoned generations are not.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[str, tuple[str, float]] = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+        self._in_flight: dict[str, _InFlightResponse] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(
+        model: str,
+        messages: list[dict],
+        system_message: str,
+        limits: dict,
+        user_id: int | None,
+    ) -> str:
+        normalized = json.dumps(
+            {
+                'user': user_id,
+                'model': model,
+                'max_output_tokens': limits["max_output_tokens"],
+                'system': system_message or '',
+                'messages': messages,
+            },
+            sort_keys=True,
+            separators=(',', ':'),
+        )
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get_or_join(self, key: str) -> tuple[str | None, _InFlightResponse, bool]:
+        """
+        Return (cached_text, None, False) on a hit. Otherwise return the in-flight
+        generation for `key` and whether the caller must start it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], None, False
+            if entry is not None:
+                self._drop_locked(key)
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+            self.misses += 1
+            flight = self._in_flight[key] = _InFlightResponse()
+            return None, flight, True
+
+    def complete(self, key: str, flight: _InFlightResponse, text: str | None) -> None:
+        """Retire `flight`, caching `text` if the generation finished cleanly."""
+        with self._lock:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+            size = len(text.encode('utf-8')) if text else 0
+            if not text or size > self.max_bytes:
+                return
+            self._drop_locked(key)
+            self._entries[key] = (text, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop_locked(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+            }
+
+    def _drop_locked(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0].encode('utf-8'))
+
+
+RESPONSE_CACHE = ResponseCache(
+    max_bytes=int(environ.get('RESPONSE_CACHE_MAX_BYTES', '0')),
+    ttl=float(environ.get('RESPONSE_CACHE_TTL', '3600')),
+)
+
+
+async def _cached_provider_tokens(
+    model_to_use: str,
+    messages_for_llm: list[dict],
+    system_message: str,
+    limits: dict,
+    api_keys: tuple[str | None, str | None] = (None, None),
+    user_id: int | None = None,
+) -> typing.AsyncIterator[str]:
+    """
+    `_provider_tokens`, served from RESPONSE_CACHE when it is enabled.
+
+    A cached reply is replayed as a single delta, so clients see the usual `token`
+    frames. A miss either starts the upstream generation or attaches to an
+    identical one from the same user already in progress.
+    """
+    if not RESPONSE_CACHE.enabled:
+        async for tok in _provider_tokens(
+            model_to_use, messages_for_llm, system_message, limits, api_keys
+        ):
+            yield tok
+        return
+
+    key = ResponseCache.key(
+        model_to_use, messages_for_llm, system_message, limits, user_id
+    )
+    text, flight, leader = RESPONSE_CACHE.get_or_join(key)
+    if text is not None:
+        print(f"Serving cached response {key[:12]} for {model_to_use}")
+        yield text
+        return
+
+    if leader:
+
+        async def _run():
+            completed = False
+            try:
+                async for tok in _provider_tokens(
+                    model_to_use, messages_for_llm, system_message, limits, api_keys
+                ):
+                    flight.publish(tok)
+                completed = True
+                flight.finish()
+            except Exception as e:
+                flight.finish(e)
+            except BaseException:
+                # Cancelled because every subscriber left; fail any late joiner.
+                flight.finish(RuntimeError("Upstream generation was cancelled"))
+                raise
+            finally:
+                RESPONSE_CACHE.complete(
+                    key, flight, "".join(flight.chunks) if completed else None
+                )
+
+        flight.task = asyncio.create_task(_run())
+    else:
+        print(f"Attaching to in-flight response {key[:12]} for {model_to_use}")
+
+    async for tok in flight.subscribe():
+        yield tok
+
+
+## Latency-aware routing: retries, hedging and failover between models.
+STREAM_RETRIES = int(environ.get('STREAM_RETRIES', '2'))
+STREAM_RETRY_BACKOFF = float(environ.get('STREAM_RETRY_BACKOFF_MS', '500')) / 1000
+HEDGE_AFTER = float(environ.get('HEDGE_AFTER_MS', '0')) / 1000
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """Connection errors and timeouts, rate limits, and 5xx/overloaded responses."""
+    if isinstance(error, (openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, (openai.APIStatusError, anthropic.APIStatusError)):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class ModelHealth:
+    """
+    Rolling time-to-first-token and error rate per model, over its last `window`
+    attempts. The TTFT quantiles set the hedging threshold, and everything is
+    reported in GET /api/admin/stats.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._ttfts: dict[str, collections.deque[float]] = {}
+        self._outcomes: dict[str, collections.deque[bool]] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, model: str, ttft: float | None, ok: bool) -> None:
+        """Record one finished attempt; `ttft` is None if no token arrived."""
+        with self._lock:
+            outcomes = self._outcomes.get(model)
+            if outcomes is None:
+                outcomes = self._outcomes[model] = collections.deque(maxlen=self.window)
+                self._ttfts[model] = collections.deque(maxlen=self.window)
+            outcomes.append(ok)
+            if ttft is not None:
+                self._ttfts[model].append(ttft)
+
+    def record_wait(self, model: str, waited: float) -> None:
+        """
+        Record an attempt cancelled before its first token, e.g. the losing side of a
+        hedge. `waited` is a lower bound on its TTFT. Without it, a model that always
+        loses the race would never get a p95 and would be hedged on every request.
+        """
+        with self._lock:
+            if model not in self._ttfts:
+                self._outcomes[model] = collections.deque(maxlen=self.window)
+                self._ttfts[model] = collections.deque(maxlen=self.window)
+            self._ttfts[model].append(waited)
+
+    def ttft_quantile(self, model: str, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._ttfts.get(model, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def hedge_delay(self, model: str) -> float | None:
+        """
+        Seconds to wait for `model`'s first token before hedging, or None if hedging
+        is off. Never below HEDGE_AFTER_MS, nor below the model's own recent p95, so a
+        model that is always slow to start (e.g. a reasoning model) is not hedged on
+        every request.
+        """
+        if HEDGE_AFTER <= 0:
+            return None
+        return max(HEDGE_AFTER, self.ttft_quantile(model, 0.95) or 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {
+                model: {
+                    'attempts': len(outcomes),
+                    'error_rate': outcomes.count(False) / len(outcomes),
+                }
+                for model, outcomes in self._outcomes.items()
+                if outcomes
+            }
+        for model, entry in models.items():
+            entry['ttft_p50'] = self.ttft_quantile(model, 0.5)
+            entry['ttft_p95'] = self.ttft_quantile(model, 0.95)
+        return {
+            'models': models,
+            'retries': self.retries,
+            'failovers': self.failovers,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+        }
+
+
+MODEL_HEALTH = ModelHealth(window=int(environ.get('MODEL_HEALTH_WINDOW', '100')))
+
+
+async def _model_tokens(ctx: dict, model: str) -> typing.AsyncIterator[str]:
+    """
+    Stream `model`'s reply to the prepared /stream context, retrying failures.
+
+    Errors before the first token are retried up to STREAM_RETRIES times with
+    jittered exponential backoff when `_is_retryable` says so. Once a token has been
+    sent, an error is final: retrying would repeat text the client already has.
+    """
+    system_message = ctx["system_message"]
+    limits = _model_limits(model)
+    messages_for_llm = _build_context(ctx["history"], model, system_message)
+    for attempt in range(STREAM_RETRIES + 1):
+        started = time.monotonic()
+        ttft = None
+        try:
+            async for tok in _cached_provider_tokens(
+                model,
+                messages_for_llm,
+                system_message,
+                limits,
+                ctx["api_keys"],
+                ctx.get("user_id"),
+            ):
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                    STREAM_TTFT_SECONDS.observe(ttft, (model,))
+                yield tok
+        except asyncio.CancelledError:
+            if ttft is None:
+                MODEL_HEALTH.record_wait(model, time.monotonic() - started)
+            raise
+        except Exception as e:
+            MODEL_HEALTH.record(model, ttft, ok=False)
+            PROVIDER_ERRORS.inc((model,))
+            if ttft is not None or attempt == STREAM_RETRIES or not _is_retryable(e):
+                raise
+            delay = STREAM_RETRY_BACKOFF * 2**attempt * random.uniform(0.5, 1.5)
+            print(f"Retrying {model} in {delay:.2f}s after error: {e}")
+            MODEL_HEALTH.retries += 1
+            await asyncio.sleep(delay)
+        else:
+            MODEL_HEALTH.record(model, ttft, ok=True)
+            return
+
+
+async def _routed_tokens(
+    ctx: dict, chosen_llm: str, route: dict
+) -> typing.AsyncIterator[str]:
+    """
+    Stream a reply for `chosen_llm`, failing over or hedging to its fallback model.
+
+    Without a fallback in shared/models.json this is just `_model_tokens`. With one,
+    the fallback is started when the chosen model fails before its first token, or,
+    with hedging on, when that first token is later than `MODEL_HEALTH.hedge_delay`.
+    Whichever model sends a token first answers and the other is cancelled, which
+    closes its provider stream. `route["model"]` is set to the answering model.
+    """
+    route["model"] = chosen_llm
+    fallback = FALLBACK_MODELS.get(chosen_llm)
+    if not fallback or fallback == chosen_llm:
+        async for tok in _model_tokens(ctx, chosen_llm):
+            yield tok
+        return
+
+    done = object()
+    items: asyncio.Queue = asyncio.Queue()
+
+    async def _pump(model):
+        try:
+            async for tok in _model_tokens(ctx, model):
+                items.put_nowait((model, tok))
+        except Exception as e:
+            items.put_nowait((model, e))
+        else:
+            items.put_nowait((model, done))
+
+    loop = asyncio.get_running_loop()
+    tasks = {chosen_llm: asyncio.create_task(_pump(chosen_llm))}
+    hedge_delay = MODEL_HEALTH.hedge_delay(chosen_llm)
+    hedge_at = loop.time() + hedge_delay if hedge_delay is not None else None
+    winner = None
+    first_error = None
+    failed = set()
+    try:
+        while True:
+            timeout = None
+            if winner is None and fallback not in tasks and hedge_at is not None:
+                timeout = max(0.0, hedge_at - loop.time())
+            try:
+                model, item = await asyncio.wait_for(items.get(), timeout)
+            except TimeoutError:
+                print(
+                    f"No first token from {chosen_llm} after {hedge_delay:.2f}s; "
+                    f"hedging to {fallback}"
+                )
+                MODEL_HEALTH.hedges += 1
+                tasks[fallback] = asyncio.create_task(_pump(fallback))
+                continue
+
+            if winner is not None and model != winner:
+                continue
+            if isinstance(item, Exception):
+                if winner is not None:
+                    raise item
+                first_error = first_error or item
+                failed.add(model)
+                if fallback not in tasks:
+                    print(f"{chosen_llm} failed ({item}); failing over to {fallback}")
+                    MODEL_HEALTH.failovers += 1
+                    tasks[fallback] = asyncio.create_task(_pump(fallback))
+                elif failed == set(tasks):
+                    raise first_error
+                continue
+
+            if winner is None:
+                winner = model
+                route["model"] = model
+                for other, task in tasks.items():
+                    if other != model:
+                        task.cancel()
+                if model == fallback and chosen_llm not in failed:
+                    MODEL_HEALTH.hedge_wins += 1
+            if item is done:
+                return
+            yield item
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+
+async def _generate_reply(
+    ctx: dict, chosen_llm: str, tagged: bool
+) -> typing.AsyncIterator[dict]:
+    """
+    Async generator yielding the event payloads of one model's reply.
+
+    Tokens are pulled from the async OpenAI/Anthropic clients through
+    `_routed_tokens` and coalesced by `_coalesce_tokens` into fewer `token` events.
+    If the fallback model answers instead, an `answered_by` event names it before
+    its first token, and the reply is saved under that model. The final message is
+    handed to the batching ASSISTANT_MESSAGE_WRITER once the provider stream ends (or
+    the client goes away), and its ID is the last event. With `tagged`, every event
+    carries the model name so several replies can share one SSE connection.
+
+    Cancelling the task that drives this generator (see `Generation.cancel`) closes
+    the provider stream, saves the partial reply with finish_reason 'cancelled' and
+    ends the reply normally with a `cancelled` event, so the closing frames still go
+    out.
+    """
+    conv_id = ctx["conversation_id"]
+    user_message_id = ctx["user_message_id"]
+    route = {}
+    assistant_message_accumulator = []
+    assistant_msg_id = None
+    finish_reason = None
+    outcome = "completed"
+    started = time.monotonic()
+    first_token_at = None
+    tag = {"model": chosen_llm} if tagged else {}
+    print(f"Starting generation from {chosen_llm} for conversation ID: {conv_id}")
+
+    model_to_use = chosen_llm
+
+    async def _accumulate(tokens):
+        # Record every delta as it arrives, before coalescing, so text that is still
+        # buffered when the client disconnects is saved too.
+        async for tok in tokens:
+            assistant_message_accumulator.append(tok)
+            yield tok
+
+    try:
+        async with contextlib.aclosing(
+            _coalesce_tokens(_accumulate(_routed_tokens(ctx, chosen_llm, route)))
+        ) as chunks:
+            async for text in chunks:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                if route["model"] != model_to_use:
+                    model_to_use = route["model"]
+                    yield {"answered_by": model_to_use, **tag}
+                yield {"token": text, **tag}
+
+    except asyncio.CancelledError:
+        # The provider stream was closed on the way out. Swallow the cancellation so
+        # the partial reply is saved and announced like a finished one.
+        asyncio.current_task().uncancel()
+        finish_reason = outcome = "cancelled"
+        print(f"Generation from {model_to_use} for conv {conv_id} was cancelled")
+
+    except Exception as e:
+        outcome = "error"
+        print(f"Error during streaming from {model_to_use} for conv {conv_id}: {e}")
+        yield {"error": "Streaming failed", **tag}
+
+    finally:
+        # No yields in here: if the client disconnected, the generator is being closed
+        # and may only await the save, not emit more frames.
+        final_assistant_text = "".join(assistant_message_accumulator)
+        print(
+            f"Finished streaming from {model_to_use} for conv {conv_id}. "
+            f"Final text length: {len(final_assistant_text)}"
+        )
+        finished_at = time.monotonic()
+        STREAM_DURATION_SECONDS.observe(finished_at - started, (model_to_use, outcome))
+        # Replies that arrive in one burst have no meaningful rate.
+        if first_token_at is not None and finished_at - first_token_at >= 0.05:
+            STREAM_TOKENS_PER_SECOND.observe(
+                estimate_tokens(final_assistant_text) / (finished_at - first_token_at),
+                (model_to_use,),
+            )
+
+        if conv_id is not None and final_assistant_text:
+            # Shielded: a cancel that lands while saving must not cancel the write.
+            try:
+                assistant_msg_id = await asyncio.shield(
+                    asyncio.wrap_future(
+                        ASSISTANT_MESSAGE_WRITER.submit(
+                            conv_id,
+                            final_assistant_text,
+                            model_to_use,
+                            user_message_id,
+                            finish_reason,
+                        )
+                    )
+                )
+            except Exception as e:
+                print(f"Error saving reply from {model_to_use} for conv {conv_id}: {e}")
+        elif conv_id is None:
+            print("Skipping final save: conversation_id is None.")
+        else:
+            print(
+                f"Skipping final save for conv {conv_id}: No assistant text generated."
+            )
+
+    if finish_reason is not None:
+        yield {"cancelled": True, **tag}
+
+    if assistant_msg_id is not None:
+        # Inform client of the assistant message ID for branching
+        yield {"assistant_message_id": assistant_msg_id, **tag}
+
+
+async def _merge_replies(
+    replies: list[typing.AsyncIterator[dict]],
+) -> typing.AsyncIterator[dict]:
+    """
+    Interleave several `_generate_reply` generators in arrival order.
+
+    Each one is drained by its own task. Cancelling the consumer's task cancels every
+    reply, and their final events are still passed on. If the consumer stops early,
+    the tasks are cancelled and awaited so every reply still runs its save before
+    this generator finishes.
+    """
+    done = object()
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def _pump(reply):
+        try:
+            async for event in reply:
+                events.put_nowait(event)
+        finally:
+            events.put_nowait(done)
+
+    tasks = [asyncio.create_task(_pump(reply)) for reply in replies]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            try:
+                event = await events.get()
+            except asyncio.CancelledError:
+                asyncio.current_task().uncancel()
+                for task in tasks:
+                    task.cancel()
+                continue
+            if event is done:
+                remaining -= 1
+            else:
+                yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _generate_stream(ctx: dict, chosen_llms: list[str]):
+    """
+    Async generator yielding the SSE frames for one /stream request.
+
+    A single model streams exactly as before. With several models, their provider
+    calls run concurrently on the event loop and their events are multiplexed on
+    this connection, each tagged with `model`. Every reply is saved as a sibling
+    under the same user message. `stream_complete` is sent once, after all of them.
+    """
+    conv_id = ctx["conversation_id"]
+    user_message_id = ctx["user_message_id"]
+
+    if ctx["is_new_conversation"]:
+        yield _sse({"new_conversation_id": conv_id})
+
+    # Inform client of the user message ID for branching
+    if user_message_id is not None:
+        yield _sse({"user_message_id": user_message_id})
+
+    if len(chosen_llms) == 1:
+        events = _generate_reply(ctx, chosen_llms[0], tagged=False)
+    else:
+        events = _merge_replies(
+            [_generate_reply(ctx, llm, tagged=True) for llm in chosen_llms]
+        )
+    async with contextlib.aclosing(events):
+        async for event in events:
+            yield _sse(event)
+
+    # Send completion signal to frontend
+    yield _sse({"stream_complete": True})
+
+
+## Connection-independent generations, resumable with Last-Event-ID.
+class Generation:
+    """
+    One /stream generation, running as a task independent of any HTTP connection.
+
+    Frames from `_generate_stream` are numbered and kept in a ring buffer of the last
+    `max_events`, each sent with an SSE `id:` of "<generation id>:<seq>". A browser
+    whose EventSource drops reconnects with that id in Last-Event-ID and is replayed
+    everything after it, then follows live, with no second upstream call. If nobody
+    is subscribed for `grace` seconds the generation is cancelled, exactly as if the
+    user had stopped it.
+    """
+
+    _DONE = object()
+
+    def __init__(
+        self, user_id: int, conversation_id: int, max_events: int, grace: float
+    ):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.grace = grace
+        self.task: asyncio.Task | None = None
+        self.finished_at: float | None = None
+        self.cancelled = False
+        self._events: collections.deque[tuple[int, str]] = collections.deque(
+            maxlen=max_events
+        )
+        self._seq = 0
+        self._subscribers: list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self._detached_at: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, ctx: dict, chosen_llms: list[str]) -> None:
+        self._publish(_sse({"generation_id": self.id}))
+        agen = _generate_stream(ctx, chosen_llms)
+        try:
+            async for frame in agen:
+                self._publish(frame)
+        except asyncio.CancelledError:
+            # Only when the cancel landed outside a reply (e.g. while it was saving).
+            if not self.cancelled:
+                raise
+            self._publish(_sse({"stream_complete": True}))
+        finally:
+            try:
+                await agen.aclose()
+            finally:
+                with self._lock:
+                    self.finished_at = time.monotonic()
+                    subscribers = list(self._subscribers)
+                for loop, queue in subscribers:
+                    loop.call_soon_threadsafe(queue.put_nowait, self._DONE)
+                ADMISSION.release(self.user_id)
+
+    def cancel(self) -> bool:
+        """
+        Stop the generation from any thread. The replies close their provider
+        streams and save what they have; subscribers get a `cancelled` event and the
+        usual closing frames. Returns False if it had already ended or been cancelled.
+        """
+        with self._lock:
+            if self.finished or self.cancelled or self.task is None:
+                return False
+            self.cancelled = True
+        self.task.get_loop().call_soon_threadsafe(self.task.cancel)
+        return True
+
+    async def subscribe(self, after_seq: int = 0) -> typing.AsyncIterator[str]:
+        """Yield the frames numbered after `after_seq`, then follow live ones."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            missed = after_seq + 1 < oldest
+            backlog = [frame for seq, frame in self._events if seq > after_seq]
+            finished = self.finished
+            if not finished and not missed:
+                self._subscribers.append((loop, queue))
+        if missed:
+            # The reply is still saved in full; the client can reload the branch.
+            yield _sse({"error": "Too much of this response was missed to resume it"})
+            return
+        try:
+            for frame in backlog:
+                yield frame
+            if not finished:
+                while (frame := await queue.get()) is not self._DONE:
+                    yield frame
+        finally:
+            with self._lock:
+                if (loop, queue) in self._subscribers:
+                    self._subscribers.remove((loop, queue))
+                detached = not self._subscribers and not self.finished
+                if detached:
+                    self._detached_at = time.monotonic()
+            if detached and self.task is not None:
+                task_loop = self.task.get_loop()
+                task_loop.call_soon_threadsafe(
+                    task_loop.call_later, self.grace, self._expire
+                )
+
+    def _publish(self, frame: str) -> None:
+        with self._lock:
+            self._seq += 1
+            frame = f"id: {self.id}:{self._seq}\n{frame}"
+            self._events.append((self._seq, frame))
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, frame)
+
+    def _expire(self) -> None:
+        # Runs on the task's loop `grace` seconds after a subscriber left; a client
+        # that came back (and maybe left again) since then resets the clock.
+        with self._lock:
+            expired = (
+                not self._subscribers
+                and not self.finished
+                and self._detached_at is not None
+                and time.monotonic() - self._detached_at >= self.grace - 0.01
+            )
+        if expired:
+            print(f"No client reconnected to generation {self.id}; cancelling it")
+            self.cancel()
+
+
+class GenerationRegistry:
+    """
+    Live and recently finished generations of this process, by generation id.
+
+    Finished generations are kept for `retention` seconds so a client that
+    reconnects just after the end still gets the closing frames.
+    """
+
+    def __init__(self, max_events: int, grace: float, retention: float):
+        self.max_events = max_events
+        self.grace = grace
+        self.retention = retention
+        self._generations: dict[str, Generation] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.resumed = 0
+        self.cancelled_by_user = 0
+
+    def start(self, ctx: dict, chosen_llms: list[str], user_id: int) -> Generation:
+        """Start a generation task on the running loop and register it."""
+        generation = Generation(
+            user_id, ctx["conversation_id"], self.max_events, self.grace
+        )
+        generation.task = asyncio.get_running_loop().create_task(
+            generation.run(ctx, chosen_llms)
+        )
+        with self._lock:
+            self._prune_locked()
+            self._generations[generation.id] = generation
+            self.started += 1
+        return generation
+
+    def get(self, generation_id: str, user_id: int) -> Generation | None:
+        with self._lock:
+            self._prune_locked()
+            generation = self._generations.get(generation_id)
+        if generation is None or generation.user_id != user_id:
+            return None
+        return generation
+
+    def cancel(
+        self,
+        user_id: int,
+        generation_id: str | None = None,
+        conversation_id: int | None = None,
+    ) -> int:
+        """
+        Cancel the user's running generation `generation_id`, or all of them in
+        `conversation_id`. Returns how many were cancelled.
+        """
+        with self._lock:
+            targets = [
+                g
+                for g in self._generations.values()
+                if g.user_id == user_id
+                and (
+                    g.id == generation_id
+                    or (
+                        conversation_id is not None
+                        and g.conversation_id == conversation_id
+                    )
+                )
+            ]
+        cancelled = sum(g.cancel() for g in targets)
+        with self._lock:
+            self.cancelled_by_user += cancelled
+        return cancelled
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = sum(not g.finished for g in self._generations.values())
+            return {
+                'live': live,
+                'retained': len(self._generations) - live,
+                'started': self.started,
+                'resumed': self.resumed,
+                'cancelled_by_user': self.cancelled_by_user,
+            }
+
+    def _prune_locked(self) -> None:
+        cutoff = time.monotonic() - self.retention
+        for generation_id, generation in list(self._generations.items()):
+            if generation.finished and generation.finished_at < cutoff:
+                del self._generations[generation_id]
+
+
+GENERATIONS = GenerationRegistry(
+    max_events=int(environ.get('GENERATION_BUFFER_EVENTS', '4096')),
+    grace=float(environ.get('GENERATION_RECONNECT_GRACE', '30')),
+    retention=float(environ.get('GENERATION_RETENTION', '60')),
+)
+CallbackMetric(
+    "gptree_active_streams",
+    "Generations currently running in this process.",
+    lambda: {(): GENERATIONS.stats()['live']},
+)
+
+
+def _parse_last_event_id(value: str | None) -> tuple[str, int] | None:
+    """Split a Last-Event-ID of the form "<generation id>:<seq>"."""
+    if not value:
+        return None
+    generation_id, _, seq = value.rpartition(":")
+    try:
+        return generation_id, int(seq)
+    except ValueError:
+        return None
+
+
+async def _start_generation(
+    ctx: dict, chosen_llms: list[str], user_id: int
+) -> Generation:
+    """
+    Start a generation for a prepared /stream request on the running loop. It is
+    started before the response is, so its admission slot is released even if the
+    client never reads a frame.
+    """
+    return GENERATIONS.start(ctx, chosen_llms, user_id)
+
+
+async def _follow_resumed_generation(
+    resume: tuple[str, int], user_id: int
+) -> typing.AsyncIterator[str]:
+    """Replay and follow an existing generation after a reconnect."""
+    generation_id, after_seq = resume
+    generation = GENERATIONS.get(generation_id, user_id)
+    if generation is None:
+        yield _sse({"error": "This response can no longer be resumed"})
+        return
+    GENERATIONS.resumed += 1
+    print(f"Resuming generation {generation_id} after event {after_seq}")
+    async for frame in generation.subscribe(after_seq):
+        yield frame
+
+
+## Per-user admission control for /stream.
+class AdmissionRejected(Exception):
+    """A /stream request refused by StreamAdmission; answered with 429 + Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)."""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class _UserAdmission:
+    __slots__ = ("requests", "tokens", "active", "waiters", "usage")
+
+    def __init__(self, requests: _TokenBucket, tokens: _TokenBucket):
+        self.requests = requests
+        self.tokens = tokens
+        self.active = 0
+        self.waiters: collections.deque[concurrent.futures.Future] = collections.deque()
+        self.usage = collections.Counter()
+
+
+class StreamAdmission:
+    """
+    Per-user admission control for new /stream generations.
+
+    Each user has two token buckets, refilled continuously: one for requests
+    (`requests_per_minute`, bursting to `request_burst`) and one for estimated LLM
+    tokens (`tokens_per_minute`, which is also its burst). An empty bucket rejects
+    the request at once, with the time until it refills as Retry-After. At most
+    `max_concurrent` generations per user run at once. Beyond that, up to
+    `max_queued` requests wait in FIFO order for up to `queue_timeout` seconds before
+    they are rejected. A slot is held for the life of the generation, not of the
+    connection, so reconnecting does not take another one. A limit of 0 disables it.
+
+    Waiters are concurrent futures, so the sync Flask route and the ASGI handler can
+    both wait for a slot. Per-user usage counters are kept for the `max_users` most
+    recently seen users and served to admins by /api/admin/usage.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        request_burst: int,
+        tokens_per_minute: float,
+        max_concurrent: int,
+        max_queued: int,
+        queue_timeout: float,
+        max_users: int,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.request_burst = max(1, request_burst)
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self._users: collections.OrderedDict[int, _UserAdmission] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id: int, estimated_tokens: int) -> None:
+        """Take a stream slot for `user_id`, waiting in the queue if needed."""
+        waiter = self._reserve(user_id, estimated_tokens)
+        if waiter is None:
+            return
+        try:
+            waiter.result(timeout=self.queue_timeout)
+        except concurrent.futures.TimeoutError:
+            self._abandon(user_id, waiter)
+
+    async def acquire_async(self, user_id: int, estimated_tokens: int) -> None:
+        """`acquire` for the event loop: waiting does not block a thread."""
+        waiter = self._reserve(user_id, estimated_tokens)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(waiter)), self.queue_timeout
+            )
+        except TimeoutError:
+            self._abandon(user_id, waiter)
+        except asyncio.CancelledError:
+            # The client left while queued; give back the slot if it was granted.
+            if not self._abandon(user_id, waiter, reject=False):
+                self.release(user_id)
+            raise
+
+    def release(self, user_id: int) -> None:
+        """Free a slot taken by `acquire` and hand it to the next waiter, if any."""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return
+            user.active -= 1
+            while user.waiters:
+                waiter = user.waiters.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    user.active += 1
+                    waiter.set_result(True)
+                    break
+
+    def usage(self) -> list[dict]:
+        """Per-user counters, busiest first."""
+        with self._lock:
+            rows = [
+                {
+                    'user_id': user_id,
+                    'active': user.active,
+                    'waiting': len(user.waiters),
+                    **user.usage,
+                }
+                for user_id, user in self._users.items()
+            ]
+        return sorted(rows, key=lambda row: row.get('requests', 0), reverse=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = collections.Counter()
+            for user in self._users.values():
+                totals.update(user.usage)
+            return {
+                'users': len(self._users),
+                'active': sum(u.active for u in self._users.values()),
+                'waiting': sum(len(u.waiters) for u in self._users.values()),
+                **totals,
+            }
+
+    def _reserve(
+        self, user_id: int, estimated_tokens: int
+    ) -> concurrent.futures.Future | None:
+        """
+        Charge the buckets and take a slot, or join the queue. Returns None when
+        admitted at once, else the future a slot will be handed over on. Raises
+        AdmissionRejected.
+        """
+        now = time.monotonic()
+        with self._lock:
+            user = self._user_locked(user_id)
+            user.usage['requests'] += 1
+            if self.requests_per_minute > 0:
+                user.requests.refill(now)
+                if user.requests.level < 1:
+                    user.usage['rejected_rate'] += 1
+                    raise AdmissionRejected(
+                        "Too many requests", user.requests.wait_for(1)
+                    )
+            if self.tokens_per_minute > 0:
+                # A single request larger than the bucket only has to wait for a full one.
+                estimated_tokens = min(estimated_tokens, user.tokens.capacity)
+                user.tokens.refill(now)
+                if user.tokens.level < estimated_tokens:
+                    user.usage['rejected_tokens'] += 1
+                    raise AdmissionRejected(
+                        "Token rate limit exceeded",
+                        user.tokens.wait_for(estimated_tokens),
+                    )
+            if (
+                self.max_concurrent > 0
+                and (user.active >= self.max_concurrent or user.waiters)
+                and len(user.waiters) >= self.max_queued
+            ):
+                user.usage['rejected_concurrency'] += 1
+                raise AdmissionRejected(
+                    "Too many concurrent responses", self.queue_timeout
+                )
+
+            if self.requests_per_minute > 0:
+                user.requests.level -= 1
+            if self.tokens_per_minute > 0:
+                user.tokens.level -= estimated_tokens
+            user.usage['estimated_tokens'] += estimated_tokens
+            user.usage['admitted'] += 1
+            if self.max_concurrent <= 0 or (
+                user.active < self.max_concurrent and not user.waiters
+            ):
+                user.active += 1
+                return None
+            user.usage['queued'] += 1
+            waiter = concurrent.futures.Future()
+            user.waiters.append(waiter)
+            return waiter
+
+    def _abandon(
+        self, user_id: int, waiter: concurrent.futures.Future, reject: bool = True
+    ) -> bool:
+        """
+        Withdraw a waiter whose wait ended. Returns True if it left the queue
+        without a slot (raising AdmissionRejected when `reject`), False if a slot
+        was handed to it meanwhile.
+        """
+        with self._lock:
+            user = self._users[user_id]
+            if waiter.done():
+                return False
+            waiter.cancel()
+            user.waiters.remove(waiter)
+            user.usage['admitted'] -= 1
+            user.usage['rejected_concurrency'] += 1
+        if reject:
+            raise AdmissionRejected("Too many concurrent responses", self.queue_timeout)
+        return True
+
+    def _user_locked(self, user_id: int) -> _UserAdmission:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserAdmission(
+                _TokenBucket(self.request_burst, self.requests_per_minute / 60),
+                _TokenBucket(self.tokens_per_minute, self.tokens_per_minute / 60),
+            )
+            # Forget the least recently seen idle users beyond the cap.
+            for old_id in list(self._users)[
+                : max(0, len(self._users) - self.max_users)
+            ]:
+                old = self._users[old_id]
+                if not old.active and not old.waiters:
+                    del self._users[old_id]
+        self._users.move_to_end(user_id)
+        return user
+
+
+ADMISSION = StreamAdmission(
+    requests_per_minute=float(environ.get('STREAM_REQUESTS_PER_MINUTE', '30')),
+    request_burst=int(environ.get('STREAM_REQUEST_BURST', '10')),
+    tokens_per_minute=float(environ.get('STREAM_TOKENS_PER_MINUTE', '200000')),
+    max_concurrent=int(environ.get('STREAM_MAX_CONCURRENT', '3')),
+    max_queued=int(environ.get('STREAM_MAX_QUEUED', '4')),
+    queue_timeout=float(environ.get('STREAM_QUEUE_TIMEOUT', '10')),
+    max_users=int(environ.get('ADMISSION_MAX_USERS', '10000')),
+)
+CallbackMetric(
+    "gptree_admission_rejections_total",
+    "New /stream requests refused by admission control, by reason.",
+    lambda: {
+        (reason,): ADMISSION.stats().get(f'rejected_{reason}', 0)
+        for reason in ('rate', 'tokens', 'concurrency')
+    },
+    ("reason",),
+    kind="counter",
+)
+
+
+def _estimate_stream_tokens(stream_args: dict) -> int:
+    """
+    Tokens a /stream request is charged up front: its new text plus the output
+    allowance of every model it asks for. The history is not loaded yet at this
+    point and is already bounded by CONTEXT_TOKEN_BUDGET.
+    """
+    prompt = estimate_tokens(stream_args["user_text"]) + estimate_tokens(
+        stream_args["system_message"]
+    )
+    return prompt + sum(
+        _model_limits(llm)["max_output_tokens"] for llm in stream_args["llm_choices"]
+    )
+
+
+def _admission_headers(rejection: AdmissionRejected) -> dict:
+    return {'Retry-After': str(max(1, math.ceil(rejection.retry_after)))}
+
+
+## Event loop used to drive `_generate_stream` from sync (WSGI) workers.
+_BACKGROUND_LOOP: asyncio.AbstractEventLoop | None = None
+_BACKGROUND_LOOP_LOCK = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background event loop, starting its thread on first use."""
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOOP_LOCK:
+        if _BACKGROUND_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="stream-event-loop", daemon=True
+            ).start()
+            _BACKGROUND_LOOP = loop
+    return _BACKGROUND_LOOP
+
+
+def _iterate_sync(agen):
+    """
+    Drain an async generator from sync code by stepping it on the background loop.
+
+    Used by the Flask /stream route so `python backend/backend.py` and plain sync
+    gunicorn workers keep working. If the WSGI server closes this generator (client
+    disconnect), the async generator is closed too so its cleanup still runs.
+    """
+    loop = _background_loop()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+@APP.route("/stream", methods=["GET"])
+@require_auth
+def stream_interaction() -> flaskResponse:
+    """
+    Stream an OpenAI or Anthropic LLM response via Server-Sent Events (SSE).
+
+    Steps:
+    1. Create or continue a conversation record in the database.
+    2. Save user and optional system messages.
+    3. Stream tokens from the chosen LLM(s) to the client in real time.
+    4. Persist each final assistant message after streaming completes.
+
+    The generation runs as a background task (see `Generation`), so a client whose
+    connection drops can reconnect with Last-Event-ID and continue where it left off.
+    New generations go through per-user admission control (see `StreamAdmission`)
+    and are answered with 429 + Retry-After when it refuses them.
+
+    This is the sync fallback; under the ASGI entrypoint (`ASGI_APP`) /stream is
+    served natively on the event loop by `_asgi_stream`.
+    """
+    user_id = flask_request.current_user['user_id']
+    # A reconnecting EventSource repeats the original URL; Last-Event-ID tells us to
+    # resume that generation rather than start another one.
+    resume = _parse_last_event_id(
+        flask_request.headers.get('Last-Event-ID')
+        or flask_request.args.get('lastEventId')
+    )
+    if resume is not None:
+        return flask.Response(
+            _iterate_sync(_follow_resumed_generation(resume, user_id)),
+            mimetype="text/event-stream",
+        )
+
+    stream_args = _parse_stream_args(flask_request.args)
+    try:
+        ADMISSION.acquire(user_id, _estimate_stream_tokens(stream_args))
+    except AdmissionRejected as e:
+        return flask.jsonify({'error': str(e)}), 429, _admission_headers(e)
+    ctx = _prepare_stream(stream_args, user_id)
+    if ctx is None:
+        ADMISSION.release(user_id)
+        error_data = _sse({"error": "Failed to prepare conversation"})
+        return flask.Response(error_data, mimetype="text/event-stream")
+
+    generation = asyncio.run_coroutine_threadsafe(
+        _start_generation(ctx, stream_args["llm_choices"], user_id), _background_loop()
+    ).result()
+    return flask.Response(
+        _iterate_sync(generation.subscribe()), mimetype="text/event-stream"
+    )
+
+
+@APP.route("/api/generations/<generation_id>/cancel", methods=['POST'])
+@require_auth
+def cancel_generation(generation_id: str) -> flaskResponse:
+    """
+    POST /api/generations/<generation_id>/cancel
+
+    Stop a running generation, whose ID is the `generation_id` event at the start of
+    its /stream response. The provider stream is closed at once and the partial reply
+    is saved with finish_reason 'cancelled'. Generations live in the process that
+    started them, which is why each server runs a single worker (see the README).
+    Answers 404 when this process has no such running generation, e.g. one that
+    already finished, so the client can tell a stop that took effect from one that
+    did not.
+    """
+    user_id = flask_request.current_user['user_id']
+    if not GENERATIONS.cancel(user_id, generation_id=generation_id):
+        return flask.jsonify({'error': 'No running generation with that ID'}), 404
+    return flask.jsonify({'success': True, 'cancelled': 1})
+
+
+@APP.route("/api/conversations/<int:conversation_id>/cancel", methods=['POST'])
+@require_auth
+def cancel_conversation_generations(conversation_id: int) -> flaskResponse:
+    """
+    POST /api/conversations/<conversation_id>/cancel
+
+    Stop every running generation of the current user in this conversation, as
+    `cancel_generation` does for one.
+    """
+    user_id = flask_request.current_user['user_id']
+    cancelled = GENERATIONS.cancel(user_id, conversation_id=conversation_id)
+    if not cancelled:
+        return (
+            flask.jsonify({'error': 'No running generation in that conversation'}),
+            404,
+        )
+    return flask.jsonify({'success': True, 'cancelled': cancelled})
+
+
+## Keyset pagination and conditional GET helpers.
+MAX_PAGE_LIMIT = 500
+
+
+def _encode_cursor(timestamp: str, row_id: int) -> str:
+    """Encode a (timestamp, id) keyset position as an opaque URL-safe cursor."""
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp from a query param as an aware datetime. Accepts a
+    trailing `Z`, and a space before the offset, which is what an unencoded `+`
+    arrives as. Timestamps without an offset are taken as UTC. Raises ValueError.
+    """
+    value = value.strip()
+    if value[-1:] in ("Z", "z"):
+        value = value[:-1] + "+00:00"
+    head, space, offset = value.rpartition(" ")
+    if space and ":" in head and re.fullmatch(r"[+-]?\d{2}(:?\d{2})?", offset):
+        value = head.rstrip() + (offset if offset[0] in "+-" else "+" + offset)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt.timezone.utc)
+    return parsed
+
+
+def _decode_cursor(
+    cursor: str, parse: typing.Callable[[str], typing.Any] = _parse_timestamp
+) -> tuple[typing.Any, int]:
+    """
+    Decode a cursor from `_encode_cursor`, parsing its first part with `parse`
+    (a timestamp by default). Raises ValueError if it is malformed.
+    """
+    try:
+        key, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return parse(key), int(row_id)
+
+
+def _parse_page_args() -> tuple[int | None, tuple[datetime, int] | None]:
+    """
+    Read the optional `limit` and `cursor` query params. A missing limit means "no
+    pagination". Raises ValueError on bad input.
+    """
+    limit_str = flask_request.args.get('limit')
+    cursor_str = flask_request.args.get('cursor')
+    limit = None
+    if limit_str is not None:
+        limit = int(limit_str)
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+    cursor = _decode_cursor(cursor_str) if cursor_str else None
+    return limit, cursor
+
+
+def _etag(*parts) -> str:
+    """Derive an ETag value from the parts that determine a response body."""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+
+
+def _not_modified(etag: str) -> flaskResponse | None:
+    """Return a bodiless 304 if the client's If-None-Match already matches `etag`."""
+    if not flask_request.if_none_match.contains_weak(etag):
+        return None
+    response = flask.Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _json_page(data: list, etag: str, next_cursor: str | None) -> flaskResponse:
+    """
+    JSON list response with a weak ETag, revalidate-every-time caching and, when more
+    rows remain, the cursor for the next page in X-Next-Cursor.
+    """
+    response = flask.jsonify(data)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response.make_conditional(flask_request)
+
+
+def _conversation_version(
+    cur, conversation_id: int, user_id: int
+) -> tuple[bool, int | None]:
+    """
+    Check that the conversation belongs to the user and read its latest message ID,
+    which versions the (append-only) message tree for caches and ETags.
+    Expects a RealDictCursor. Returns (found, last_id).
+    """
+    cur.execute(
+        """
+        SELECT (
+            SELECT max(m.id) FROM messages m WHERE m.conversation_id = c.id
+        ) AS last_id
+        FROM conversations c
+        WHERE c.id = %s AND c.user_id = %s
+        """,
+        (conversation_id, user_id),
+    )
+    conversation = cur.fetchone()
+    if conversation is None:
+        return False, None
+    return True, conversation['last_id']
+
+
+def _parse_since(since_str: str | None) -> int | datetime | None:
+    """Parse `since` as a message ID or an ISO timestamp; raises ValueError if neither."""
+    if not since_str:
+        return None
+    if since_str.isdigit():
+        return int(since_str)
+    return _parse_timestamp(since_str)
+
+
+def _load_conversation_messages(
+    cur, conversation_id: int, last_id: int | None
+) -> list[CachedMessage]:
+    """Return every message of a conversation, from the tree cache or Postgres."""
+    messages = CONVERSATION_CACHE.get(conversation_id, last_id)
+    if messages is not None:
+        return messages
+    # A full load doubles as a cache fill.
+    cur.execute(
+        """
+        SELECT
+            id,
+            message_text,
+            sender_name,
+            sent_at,
+            llm_model,
+            llm_provider,
+            finish_reason,
+            parent_message_id
+        FROM messages
+        WHERE conversation_id = %s
+        ORDER BY sent_at ASC, id ASC
+        """,
+        (conversation_id,),
+    )
+    messages = [_cached_message_from_row(msg) for msg in cur.fetchall()]
+    CONVERSATION_CACHE.put(conversation_id, messages)
+    return messages
+
+
+def _messages_since(
+    cur, conversation_id: int, last_id: int | None, since: int | datetime, etag: str
+) -> flaskResponse:
+    """Build the delta-mode response of get_messages (see its docstring)."""
+    reset = False
+    cached = CONVERSATION_CACHE.get(conversation_id, last_id)
+    if isinstance(since, int):
+        if cached is not None:
+            known = any(m.id == since for m in cached)
+        else:
+            cur.execute(
+                "SELECT 1 FROM messages WHERE id = %s AND conversation_id = %s",
+                (since, conversation_id),
+            )
+            known = cur.fetchone() is not None
+        if not known:
+            reset = True
+            messages = _load_conversation_messages(cur, conversation_id, last_id)
+        elif cached is not None:
+            messages = [m for m in cached if m.id > since]
+        else:
+            cur.execute(
+                """
+                SELECT
+                    id,
+                    message_text,
+                    sender_name,
+                    sent_at,
+                    llm_model,
+                    llm_provider,
+                    finish_reason,
+                    parent_message_id
+                FROM messages
+                WHERE conversation_id = %s AND id > %s
+                ORDER BY sent_at ASC, id ASC
+                """,
+                (conversation_id, since),
+            )
+            messages = [_cached_message_from_row(msg) for msg in cur.fetchall()]
+    elif cached is not None:
+        messages = [m for m in cached if datetime.fromisoformat(m.sent_at) > since]
+    else:
+        cur.execute(
+            """
+            SELECT
+                id,
+                message_text,
+                sender_name,
+                sent_at,
+                llm_model,
+                llm_provider,
+                finish_reason,
+                parent_message_id
+            FROM messages
+            WHERE conversation_id = %s AND sent_at > %s
+            ORDER BY sent_at ASC, id ASC
+            """,
+            (conversation_id, since),
+        )
+        messages = [_cached_message_from_row(msg) for msg in cur.fetchall()]
+
+    response = flask.jsonify(
+        {
+            'messages': [_message_json(m) for m in messages],
+            'last_id': last_id,
+            'reset': reset,
+        }
+    )
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@APP.route("/api/conversations", methods=['GET'])
+@optional_auth
+def get_conversations() -> flaskResponse:
+    """
+    GET /api/conversations?limit=<n>&cursor=<cursor>
+
+    Return the user's conversations, newest first, with their IDs and topics.
+    If user is not authenticated, return empty list.
+
+    Without `limit` every conversation is returned. With it, at most `limit` are
+    returned starting after `cursor`, and X-Next-Cursor is set when more remain.
+
+    The weak ETag is derived from the user's conversation count and latest
+    `updated_at` (set on create and rename), plus the page requested. Those come
+    from an index-only scan, so a matching If-None-Match gets a 304 without
+    running the list query.
+    """
+    # If no user is authenticated, return empty list
+    if not flask_request.current_user:
+        return flask.jsonify([])
+
+    try:
+        limit, cursor = _parse_page_args()
+    except ValueError:
+        return flask.jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        user_id = flask_request.current_user['user_id']
+        cur.execute(
+            """
+            SELECT count(*), max(updated_at)
+            FROM conversations
+            WHERE user_id = %s
+            """,
+            (user_id,),
+        )
+        count, last_updated = cur.fetchone()
+        etag = _etag('conversations', count, last_updated, limit, cursor)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        query = """
+            SELECT id, conversation_topic, created_at
+            FROM conversations
+            WHERE user_id = %s
+            """
+        params = [user_id]
+        if cursor is not None:
+            query += " AND (created_at, id) < (%s, %s)"
+            params.extend(cursor)
+        query += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            # One extra row tells us whether there is a next page.
+            query += " LIMIT %s"
+            params.append(limit + 1)
+        cur.execute(query, params)
+        conversations = cur.fetchall()
+
+        next_cursor = None
+        if limit is not None and len(conversations) > limit:
+            conversations = conversations[:limit]
+            last = conversations[-1]
+            next_cursor = _encode_cursor(last[2].isoformat(), last[0])
+        data = [{'id': conv[0], 'topic': conv[1]} for conv in conversations]
+        return _json_page(data, etag, next_cursor)
+    except Exception as e:
+        print("An error occurred", e)
+        return flask.jsonify({'error': 'Internal Server Error'}), 500
+    finally:
+        if conn:
+            cur.close()
+            release_db_connection(conn)
+
+
+@APP.route("/api/messages/<int:conversation_id>", methods=['GET'])
+@require_auth
+def get_messages(conversation_id: int) -> flaskResponse:
+    """
+    GET /api/messages/<conversation_id>?limit=<n>&cursor=<cursor>
+
+    Return messages for a given conversation in chronological order. Served from
+    CONVERSATION_CACHE when the cached tree is still current.
+
+    Without `limit` every message is returned. With it, at most `limit` messages after
+    `cursor` are returned and X-Next-Cursor is set when more remain. Messages are
+    append-only, so the weak ETag is derived from the conversation's latest message ID
+    and a matching If-None-Match gets a 304 without loading any messages.
+
+    GET /api/messages/<conversation_id>?since=<message id or ISO timestamp>
+
+    Delta mode for clients that already hold the tree: returns
+    {'messages': [...newer messages], 'last_id': ..., 'reset': bool}. `last_id` is the
+    conversation's version marker. `reset` is true when the `since` message ID is not in
+    this conversation, in which case `messages` is the full list and the client should
+    replace what it has. A timestamp without an offset is taken as UTC.
     """
-    # If no user is authenticated, return empty list
-    if not flask_request.current_user:
-        return flask.jsonify([])
+    try:
+        limit, cursor = _parse_page_args()
+        since = _parse_since(flask_request.args.get('since'))
+    except ValueError:
+        return flask.jsonify({'error': 'Invalid limit, cursor or since'}), 400
+    if since is not None and (limit is not None or cursor is not None):
+        return (
+            flask.jsonify({'error': 'since cannot be combined with limit or cursor'}),
+            400,
+        )
 
     conn = None
     cur = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT id, conversation_topic
-            FROM conversations
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            """,
-            (flask_request.current_user['user_id'],),
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        found, last_id = _conversation_version(
+            cur, conversation_id, flask_request.current_user['user_id']
         )
-        conversations = cur.fetchall()
-        return flask.jsonify(
-            [{'id': conv[0], 'topic': conv[1]} for conv in conversations]
+        if not found:
+            return flask.jsonify({'error': 'Not found'}), 404
+        etag = _etag(
+            'messages',
+            conversation_id,
+            last_id,
+            limit,
+            flask_request.args.get('cursor'),
+            flask_request.args.get('since'),
         )
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        if since is not None:
+            return _messages_since(cur, conversation_id, last_id, since, etag)
+
+        if limit is None:
+            messages = _load_conversation_messages(cur, conversation_id, last_id)
+        else:
+            messages = CONVERSATION_CACHE.get(conversation_id, last_id)
+
+        if messages is not None:
+            if cursor is not None:
+                messages = [
+                    m
+                    for m in messages
+                    if (datetime.fromisoformat(m.sent_at), m.id) > cursor
+                ]
+            page = messages if limit is None else messages[: limit + 1]
+        else:
+            query = """
+                SELECT
+                    id,
+                    message_text,
+                    sender_name,
+                    sent_at,
+                    llm_model,
+                    llm_provider,
+                    finish_reason,
+                    parent_message_id
+                FROM messages
+                WHERE conversation_id = %s
+                """
+            params = [conversation_id]
+            if cursor is not None:
+                query += " AND (sent_at, id) > (%s, %s)"
+                params.extend(cursor)
+            query += " ORDER BY sent_at ASC, id ASC LIMIT %s"
+            params.append(limit + 1)
+            cur.execute(query, params)
+            page = [_cached_message_from_row(msg) for msg in cur.fetchall()]
+
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = _encode_cursor(page[-1].sent_at, page[-1].id)
+        return _json_page([_message_json(m) for m in page], etag, next_cursor)
     except Exception as e:
-        print("An error occurred", e)
+        print("An error occurred retrieving messages:", e)
         return flask.jsonify({'error': 'Internal Server Error'}), 500
     finally:
         if conn:
@@ -506,59 +4164,253 @@ def get_conversations() -> flaskResponse:
             release_db_connection(conn)
 
 
-@APP.route("/api/messages/<int:conversation_id>", methods=['GET'])
+@APP.route(
+    "/api/messages/<int:conversation_id>/branch/<int:message_id>", methods=['GET']
+)
 @require_auth
-def get_messages(conversation_id: int) -> flaskResponse:
+def get_branch(conversation_id: int, message_id: int) -> flaskResponse:
     """
-    GET /api/messages/<conversation_id>
+    GET /api/messages/<conversation_id>/branch/<message_id>
 
-    Return all messages for a given conversation in chronological order.
+    Return only the root-to-leaf path ending at `message_id`, oldest first, plus the
+    conversation's system message. Each node on the path carries `sibling_ids`: the IDs
+    (not the text) of the other replies to the same parent, so the UI can offer branch
+    switching without loading dead branches. Cost grows with the depth of the path, not
+    the size of the tree.
     """
     conn = None
     cur = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        # Ensure conversation belongs to current user
+        found, last_id = _conversation_version(
+            cur, conversation_id, flask_request.current_user['user_id']
+        )
+        if not found:
+            return flask.jsonify({'error': 'Not found'}), 404
+        etag = _etag('branch', conversation_id, last_id, message_id)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
         cur.execute(
-            "SELECT 1 FROM conversations WHERE id = %s AND user_id = %s",
-            (conversation_id, flask_request.current_user['user_id']),
+            """
+            WITH RECURSIVE branch AS (
+                SELECT id, parent_message_id, 0 AS depth
+                FROM messages
+                WHERE id = %s AND conversation_id = %s
+                UNION ALL
+                SELECT m.id, m.parent_message_id, b.depth + 1
+                FROM messages m
+                JOIN branch b ON m.id = b.parent_message_id
+                WHERE m.conversation_id = %s
+            )
+            SELECT
+                m.id,
+                m.message_text,
+                m.sender_name,
+                m.sent_at,
+                m.llm_model,
+                m.llm_provider,
+                m.finish_reason,
+                m.parent_message_id,
+                ARRAY(
+                    -- Equality probes idx_messages_parent_message_id; only roots
+                    -- (no parent) fall back to scanning their conversation.
+                    SELECT s.id
+                    FROM messages s
+                    WHERE s.parent_message_id = m.parent_message_id
+                        AND s.conversation_id = m.conversation_id
+                        AND s.id <> m.id
+                        AND s.sender_name <> 'system'
+                    UNION ALL
+                    SELECT s.id
+                    FROM messages s
+                    WHERE m.parent_message_id IS NULL
+                        AND s.parent_message_id IS NULL
+                        AND s.conversation_id = m.conversation_id
+                        AND s.id <> m.id
+                        AND s.sender_name <> 'system'
+                    ORDER BY id
+                ) AS sibling_ids
+            FROM branch b
+            JOIN messages m ON m.id = b.id
+            ORDER BY b.depth DESC
+            """,
+            (message_id, conversation_id, conversation_id),
         )
-        if cur.fetchone() is None:
+        rows = cur.fetchall()
+        if not rows:
             return flask.jsonify({'error': 'Not found'}), 404
+        path = [
+            {
+                **_message_json(_cached_message_from_row(row)),
+                'sibling_ids': row['sibling_ids'],
+            }
+            for row in rows
+        ]
+
         cur.execute(
             """
-            SELECT 
-                id, 
-                message_text, 
-                sender_name, 
-                sent_at, 
-                llm_model, 
-                llm_provider, 
-                parent_message_id
+            SELECT message_text
             FROM messages
-            WHERE conversation_id = %s
-            ORDER BY sent_at ASC
+            WHERE conversation_id = %s AND sender_name = 'system'
+            ORDER BY sent_at ASC, id ASC
+            LIMIT 1
             """,
             (conversation_id,),
         )
-        messages_raw = cur.fetchall()
-        messages_processed = []
-        for msg in messages_raw:
-            messages_processed.append(
-                {
-                    'id': msg['id'],
-                    'text': msg['message_text'],
-                    'sender': msg['sender_name'],
-                    'sent_at': msg['sent_at'].isoformat(),
-                    'llm_model': msg['llm_model'],
-                    'llm_provider': msg['llm_provider'],
-                    'parent_message_id': msg.get('parent_message_id'),
-                }
+        system_row = cur.fetchone()
+
+        response = flask.jsonify(
+            {
+                'path': path,
+                'system_message': system_row['message_text'] if system_row else None,
+                'last_id': last_id,
+            }
+        )
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        print("An error occurred retrieving branch:", e)
+        return flask.jsonify({'error': 'Internal Server Error'}), 500
+    finally:
+        if conn:
+            cur.close()
+            release_db_connection(conn)
+
+
+## Full-text search over the user's messages.
+SEARCH_DEFAULT_LIMIT = 20
+# Private-use characters mark matches in ts_headline output, so the snippet can be
+# HTML-escaped before they are turned into <mark> tags.
+_MATCH_START = "\ue000"
+_MATCH_STOP = "\ue001"
+_HEADLINE_OPTIONS = (
+    f'StartSel="{_MATCH_START}", StopSel="{_MATCH_STOP}", '
+    'MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+
+def _snippet_html(headline: str) -> str:
+    """HTML-escape a ts_headline result and wrap its matches in <mark>."""
+    return (
+        html.escape(headline, quote=False)
+        .replace(_MATCH_START, "<mark>")
+        .replace(_MATCH_STOP, "</mark>")
+    )
+
+
+@APP.route("/api/search", methods=['GET'])
+@require_auth
+def search_messages() -> flaskResponse:
+    """
+    GET /api/search?q=<query>&limit=<n>&cursor=<cursor>
+
+    Full-text search over the current user's messages, best matches first. `q` uses
+    web search syntax: "quoted phrases", `or`, and `-excluded` words. Each hit has its
+    conversation and message IDs, so the client can open the conversation at that
+    branch, and an HTML snippet with the matches wrapped in <mark>.
+
+    Matching goes through the GIN expression index on the message text's tsvector
+    (migration 013), and snippets are only built for the returned page. At most `limit` hits (default
+    SEARCH_DEFAULT_LIMIT) are returned, ordered by (rank, id), and X-Next-Cursor is
+    set when more remain.
+    """
+    query_text = flask_request.args.get('q', '').strip()
+    if not query_text:
+        return flask.jsonify({'error': 'q is required'}), 400
+    try:
+        limit = int(flask_request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+        cursor_str = flask_request.args.get('cursor')
+        cursor = _decode_cursor(cursor_str, float) if cursor_str else None
+    except ValueError:
+        return flask.jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        keyset = ""
+        params = [query_text, flask_request.current_user['user_id']]
+        if cursor is not None:
+            # ts_rank_cd returns real; compare at that precision so the cursor's
+            # rank matches the row it came from exactly.
+            keyset = "AND (rank, id) < (%s::real, %s)"
+            params.extend(cursor)
+        params.extend([limit + 1, _HEADLINE_OPTIONS])
+        cur.execute(
+            f"""
+            WITH query AS (
+                SELECT websearch_to_tsquery('english', %s) AS tsquery
+            ),
+            hits AS (
+                SELECT
+                    m.id,
+                    m.conversation_id,
+                    c.conversation_topic,
+                    m.sender_name,
+                    m.llm_model,
+                    m.sent_at,
+                    m.message_text,
+                    ts_rank_cd(to_tsvector('english', m.message_text), query.tsquery)
+                        AS rank
+                FROM messages m
+                JOIN conversations c ON c.id = m.conversation_id
+                CROSS JOIN query
+                WHERE c.user_id = %s
+                  AND m.sender_name <> 'system'
+                  -- Must match idx_messages_message_text_fts's expression.
+                  AND to_tsvector('english', m.message_text) @@ query.tsquery
+            ),
+            page AS (
+                SELECT * FROM hits
+                WHERE true {keyset}
+                ORDER BY rank DESC, id DESC
+                LIMIT %s
             )
-        return flask.jsonify(messages_processed)
+            SELECT
+                page.id,
+                page.conversation_id,
+                page.conversation_topic,
+                page.sender_name,
+                page.llm_model,
+                page.sent_at,
+                page.rank,
+                ts_headline('english', page.message_text, query.tsquery, %s)
+                    AS headline
+            FROM page
+            CROSS JOIN query
+            ORDER BY page.rank DESC, page.id DESC
+            """,
+            params,
+        )
+        rows = cur.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(repr(rows[-1]['rank']), rows[-1]['id'])
+        data = [
+            {
+                'message_id': row['id'],
+                'conversation_id': row['conversation_id'],
+                'conversation_topic': row['conversation_topic'],
+                'sender': row['sender_name'],
+                'llm_model': row['llm_model'],
+                'sent_at': row['sent_at'].isoformat(),
+                'rank': row['rank'],
+                'snippet': _snippet_html(row['headline']),
+            }
+            for row in rows
+        ]
+        return _json_page(data, _etag(data, next_cursor), next_cursor)
     except Exception as e:
-        print("An error occurred retrieving messages:", e)
+        print("An error occurred searching messages:", e)
         return flask.jsonify({'error': 'Internal Server Error'}), 500
     finally:
         if conn:
@@ -588,10 +4440,12 @@ def update_conversation(id: int) -> flaskResponse:
         if cur.fetchone() is None:
             return flask.jsonify({'error': 'Not found'}), 404
         cur.execute(
-            'UPDATE conversations SET conversation_topic = %s WHERE id = %s',
+            'UPDATE conversations SET conversation_topic = %s, updated_at = NOW() '
+            'WHERE id = %s',
             (topic, id),
         )
         conn.commit()
+        CONVERSATION_CACHE.invalidate(id)
         return flask.jsonify({'success': True})
     except Exception as e:
         print("An error occurred:", e)
@@ -627,6 +4481,7 @@ def delete_conversation(id: int) -> flaskResponse:
         cur.execute("DELETE FROM messages WHERE conversation_id = %s", (id,))
         cur.execute("DELETE FROM conversations WHERE id = %s", (id,))
         conn.commit()
+        CONVERSATION_CACHE.invalidate(id)
         return flask.jsonify({'success': True})
     except Exception as e:
         print("Error deleting conversation:", e)
@@ -639,6 +4494,39 @@ def delete_conversation(id: int) -> flaskResponse:
             release_db_connection(conn)
 
 
+def _password_hasher_busy() -> tuple:
+    """503 response for when the password hashing pool is saturated."""
+    return (
+        flask.jsonify({'error': 'Server busy, please retry shortly'}),
+        503,
+        {'Retry-After': '1'},
+    )
+
+
+def _store_rehashed_password(user_id: int, old_hash: str, new_hash: str) -> None:
+    """Replace a password hash made with an outdated cost, unless it changed since."""
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+            (new_hash, user_id, old_hash),
+        )
+        conn.commit()
+        PASSWORD_HASHER.rehashed += 1
+    except Exception as e:
+        print(f"Error rehashing password for user_id={user_id}: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
+
+
 @APP.route("/api/auth/register", methods=['POST'])
 def register() -> flaskResponse:
     """
@@ -659,6 +4547,13 @@ def register() -> flaskResponse:
             400,
         )
 
+    # Hash before taking a DB connection so no connection is held while bcrypt waits
+    # for a free slot.
+    try:
+        password_hash = hash_password(password)
+    except PasswordHasherBusy:
+        return _password_hasher_busy()
+
     conn = None
     cur = None
     try:
@@ -671,7 +4566,6 @@ def register() -> flaskResponse:
             return flask.jsonify({'error': 'User with this email already exists'}), 400
 
         # Create new user
-        password_hash = hash_password(password)
         cur.execute(
             "INSERT INTO users (email, password_hash) VALUES (%s, %s) "
             "RETURNING id, is_admin",
@@ -706,7 +4600,8 @@ def login() -> flaskResponse:
     """
     POST /api/auth/login
 
-    Login with email and password.
+    Login with email and password. A hash made with a different cost than
+    BCRYPT_ROUNDS is transparently replaced after a successful login.
     """
     data = flask_request.get_json()
     if not data or not data.get('email') or not data.get('password'):
@@ -726,11 +4621,28 @@ def login() -> flaskResponse:
             "SELECT id, password_hash, is_admin FROM users WHERE email = %s", (email,)
         )
         user = cur.fetchone()
+    except Exception as e:
+        print("Error logging in user:", e)
+        return flask.jsonify({'error': 'Internal Server Error'}), 500
+    finally:
+        # Released before bcrypt runs, which may queue behind other logins.
+        if conn:
+            cur.close()
+            release_db_connection(conn)
 
+    try:
         if not user or not verify_password(password, user[1]):
             return flask.jsonify({'error': 'Invalid email or password'}), 401
 
-        user_id, _, is_admin = user
+        user_id, password_hash, is_admin = user
+        if PASSWORD_HASHER.needs_rehash(password_hash):
+            try:
+                new_hash = hash_password(password)
+            except PasswordHasherBusy:
+                # Not worth failing the login over; retried on the next one.
+                new_hash = None
+            if new_hash:
+                _store_rehashed_password(user_id, password_hash, new_hash)
 
         # Generate token
         token = generate_token(user_id, email, is_admin)
@@ -742,15 +4654,85 @@ def login() -> flaskResponse:
             }
         )
 
+    except PasswordHasherBusy:
+        return _password_hasher_busy()
     except Exception as e:
         print("Error logging in user:", e)
         return flask.jsonify({'error': 'Internal Server Error'}), 500
-    finally:
+
+
+def _record_revocation(
+    user_id: int, jti: str | None, revoked_at: datetime, expires_at: datetime
+) -> None:
+    """Insert a token_revocations row (one token if `jti` is set, else all of them)."""
+    conn = None
+    cur = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO token_revocations (jti, user_id, revoked_at, expires_at)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (jti, user_id, revoked_at, expires_at),
+        )
+        conn.commit()
+    except Exception:
         if conn:
+            conn.rollback()
+        raise
+    finally:
+        if cur:
             cur.close()
+        if conn:
             release_db_connection(conn)
 
 
+@APP.route("/api/auth/logout", methods=['POST'])
+@require_auth
+def logout() -> flaskResponse:
+    """
+    POST /api/auth/logout
+
+    Revoke the token used for this request. Tokens issued before revocation support
+    carry no `jti`; for those, all of the user's sessions are revoked instead.
+    """
+    user = flask_request.current_user
+    now = datetime.now(dt.UTC)
+    try:
+        if user.get('jti'):
+            expires_at = datetime.fromtimestamp(user['exp'], dt.UTC)
+            _record_revocation(user['user_id'], user['jti'], now, expires_at)
+            TOKEN_REVOCATIONS.revoke_token(user['jti'], float(user['exp']))
+        else:
+            _record_revocation(user['user_id'], None, now, now + TOKEN_LIFETIME)
+            TOKEN_REVOCATIONS.revoke_user(user['user_id'], now.timestamp())
+        return flask.jsonify({'success': True})
+    except Exception as e:
+        print(f"Error logging out user_id={user['user_id']}: {e}")
+        return flask.jsonify({'error': 'Internal Server Error'}), 500
+
+
+@APP.route("/api/auth/logout-all", methods=['POST'])
+@require_auth
+def logout_all() -> flaskResponse:
+    """
+    POST /api/auth/logout-all
+
+    Revoke every token of the current user issued up to now, including this one.
+    """
+    user = flask_request.current_user
+    now = datetime.now(dt.UTC)
+    try:
+        _record_revocation(user['user_id'], None, now, now + TOKEN_LIFETIME)
+        TOKEN_REVOCATIONS.revoke_user(user['user_id'], now.timestamp())
+        return flask.jsonify({'success': True})
+    except Exception as e:
+        print(f"Error revoking all sessions for user_id={user['user_id']}: {e}")
+        return flask.jsonify({'error': 'Internal Server Error'}), 500
+
+
 @APP.route("/api/auth/me", methods=['GET'])
 @require_auth
 def get_current_user() -> flaskResponse:
@@ -816,6 +4798,7 @@ def update_user_keys() -> flaskResponse:
             (openai_key, anthropic_key, flask_request.current_user['user_id']),
         )
         conn.commit()
+        USER_API_KEYS.invalidate(flask_request.current_user['user_id'])
         return flask.jsonify({'success': True})
     except Exception as e:
         print("Error updating user keys:", e)
@@ -828,6 +4811,228 @@ def update_user_keys() -> flaskResponse:
             release_db_connection(conn)
 
 
+@APP.route("/api/admin/stats", methods=['GET'])
+@require_auth
+@require_admin
+def get_admin_stats() -> flaskResponse:
+    """
+    GET /api/admin/stats
+
+    Return in-process counters (conversation tree cache, DB pool, assistant message
+    writer, token cache/revocations, password hashing, per-user provider clients,
+    Anthropic prompt cache usage, the response cache, generations, per-model routing
+    health and /stream admission totals) for this worker.
+    """
+    return flask.jsonify(
+        {
+            'conversation_cache': CONVERSATION_CACHE.stats(),
+            'db_pool': postgreSQL_pool.stats(),
+            'assistant_message_writer': ASSISTANT_MESSAGE_WRITER.stats(),
+            'token_cache': VERIFIED_TOKEN_CACHE.stats(),
+            'token_revocations': TOKEN_REVOCATIONS.stats(),
+            'password_hasher': PASSWORD_HASHER.stats(),
+            'provider_clients': PROVIDER_CLIENTS.stats(),
+            'anthropic_prompt_cache': PROMPT_CACHE_STATS.stats(),
+            'response_cache': RESPONSE_CACHE.stats(),
+            'generations': GENERATIONS.stats(),
+            'model_routing': MODEL_HEALTH.stats(),
+            'admission': ADMISSION.stats(),
+        }
+    )
+
+
+@APP.route("/api/admin/usage", methods=['GET'])
+@require_auth
+@require_admin
+def get_admin_usage() -> flaskResponse:
+    """
+    GET /api/admin/usage
+
+    Per-user /stream admission counters for this worker, busiest first: requests,
+    admitted, queued, rejected by reason and estimated tokens charged, plus the
+    streams each user has running or waiting right now.
+    """
+    return flask.jsonify({'users': ADMISSION.usage()})
+
+
+## Request timing and the Prometheus scrape endpoint.
+METRICS_TOKEN = environ.get('METRICS_TOKEN', '')
+
+
+@APP.before_request
+def start_request_timer() -> None:
+    """Remember when the request started so `record_request_duration` can time it."""
+    flask.g.request_started = time.monotonic()
+
+
+@APP.after_request
+def record_request_duration(response: flaskResponse) -> flaskResponse:
+    """
+    Observe the request in gptree_http_request_duration_seconds.
+
+    Routes are labelled by their URL rule rather than the raw path so IDs don't blow
+    up the label cardinality. Streamed responses are timed until their headers are
+    ready; /stream latency is covered by the per-reply metrics instead.
+    """
+    started = flask.g.pop('request_started', None)
+    if started is not None:
+        rule = flask_request.url_rule
+        HTTP_REQUEST_SECONDS.observe(
+            time.monotonic() - started,
+            (
+                flask_request.method,
+                rule.rule if rule is not None else "unmatched",
+                str(response.status_code),
+            ),
+        )
+    return response
+
+
+def _metrics_response() -> flaskResponse:
+    return flask.Response(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@APP.route("/metrics", methods=['GET'])
+def get_metrics() -> flaskResponse:
+    """
+    GET /metrics
+
+    This worker's metrics in the Prometheus text exposition format. Scrapers send
+    `Authorization: Bearer $METRICS_TOKEN`; admins can also use their usual JWT.
+    """
+    header = flask_request.headers.get('Authorization', '')
+    if METRICS_TOKEN and hmac.compare_digest(
+        header.encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        return _metrics_response()
+    return require_auth(require_admin(_metrics_response))()
+
+
+## Static assets built by Vite, and compression of JSON responses.
+class StaticAsset(typing.NamedTuple):
+    """One file in `dist/`, with any precompressed siblings found next to it."""
+
+    path: pathlib.Path
+    mimetype: str
+    etag: str
+    immutable: bool
+    variants: dict  # content-coding ("br"/"gzip") -> pathlib.Path
+
+
+class StaticAssets:
+    """
+    Index of the Vite `dist/` bundle, built once at startup.
+
+    Requests are answered from the index instead of stat-ing the filesystem. If a
+    `.br` or `.gz` sibling was written by the build (see `frontend/vite.config.js`),
+    it is sent to clients that accept that coding. Vite's content-hashed files under
+    `assets/` get a one-year immutable Cache-Control; everything else (notably
+    `index.html`) must be revalidated and is answered with 304 when unchanged.
+    """
+
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+    HASHED_NAME = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+    IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+    REVALIDATE_CACHE_CONTROL = "no-cache"
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self.assets: dict[str, StaticAsset] = {}
+        if not root.is_dir():
+            print(f"Static directory {root} not found; only the API will be served.")
+            return
+        suffixes = tuple(suffix for _, suffix in self.ENCODINGS)
+        for path in sorted(root.rglob("*")):
+            if not path.is_file() or path.name.endswith(suffixes):
+                continue
+            name = path.relative_to(root).as_posix()
+            stat = path.stat()
+            variants = {}
+            for coding, suffix in self.ENCODINGS:
+                compressed = path.with_name(path.name + suffix)
+                if compressed.is_file():
+                    variants[coding] = compressed
+            self.assets[name] = StaticAsset(
+                path=path,
+                mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+                etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+                immutable=bool(self.HASHED_NAME.match(name)),
+                variants=variants,
+            )
+        print(f"Indexed {len(self.assets)} static files from {root}")
+
+    def get(self, name: str) -> StaticAsset | None:
+        return self.assets.get(name)
+
+    def send(self, asset: StaticAsset) -> flaskResponse:
+        """Send `asset`, picking a precompressed variant from Accept-Encoding."""
+        path, etag, coding = asset.path, asset.etag, None
+        for candidate, _ in self.ENCODINGS:
+            if candidate in asset.variants and _accepts_encoding(candidate):
+                path, etag, coding = (
+                    asset.variants[candidate],
+                    f"{asset.etag}-{candidate}",
+                    candidate,
+                )
+                break
+
+        response = flask.send_file(
+            path, mimetype=asset.mimetype, conditional=True, etag=etag
+        )
+        if coding:
+            response.headers['Content-Encoding'] = coding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = (
+            self.IMMUTABLE_CACHE_CONTROL
+            if asset.immutable
+            else self.REVALIDATE_CACHE_CONTROL
+        )
+        return response
+
+
+STATIC_ASSETS = StaticAssets(STATIC_DIR)
+JSON_COMPRESS_MIN_BYTES = int(environ.get('JSON_COMPRESS_MIN_BYTES', '1024'))
+JSON_COMPRESS_LEVEL = int(environ.get('JSON_COMPRESS_LEVEL', '6'))
+
+
+def _accepts_encoding(coding: str) -> bool:
+    """True if the current request's Accept-Encoding allows `coding`."""
+    return flask_request.accept_encodings[coding] > 0
+
+
+@APP.after_request
+def compress_json_response(response: flaskResponse) -> flaskResponse:
+    """
+    Gzip JSON API responses of at least JSON_COMPRESS_MIN_BYTES.
+
+    Message lists and branch paths compress very well, while small payloads are left
+    alone because the gzip framing would outweigh the savings. Streaming responses
+    (SSE) are never touched.
+    """
+    if (
+        JSON_COMPRESS_MIN_BYTES <= 0
+        or response.mimetype != "application/json"
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < JSON_COMPRESS_MIN_BYTES or not _accepts_encoding("gzip"):
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=JSON_COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 @APP.route("/", defaults={"requested_path": ""})
 @APP.route("/<path:requested_path>")
 def serve_spa(requested_path: str):
@@ -835,15 +5040,13 @@ def serve_spa(requested_path: str):
     Serve static files built by Vite or fall back to index.html so React Router deep
     links work in production.
     """
-    full_path = pathlib.Path(APP.static_folder) / requested_path
-
-    if requested_path and full_path.exists():
-        # Path points to an actual file inside frontend/dist `flask.send_from_directory`
-        # still needs string paths.
-        return flask.send_from_directory(APP.static_folder, requested_path)
-
-    # Otherwise send index.html for SPA routing
-    return flask.send_from_directory(APP.static_folder, "index.html")
+    asset = STATIC_ASSETS.get(requested_path) if requested_path else None
+    if asset is None:
+        # Otherwise send index.html for SPA routing
+        asset = STATIC_ASSETS.get("index.html")
+    if asset is None:
+        flask.abort(404)
+    return STATIC_ASSETS.send(asset)
 
 
 def _get_current_date_and_time_string() -> str:
@@ -862,5 +5065,154 @@ def release_db_connection(conn: psycopg2.extensions.connection) -> None:
     postgreSQL_pool.putconn(conn)
 
 
+async def _asgi_send_json(
+    send, status: int, body: dict, headers: dict | None = None
+) -> None:
+    """Send a complete JSON response over ASGI."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"access-control-allow-origin", b"*"),
+            ]
+            + [
+                (k.lower().encode("latin-1"), v.encode("latin-1"))
+                for k, v in (headers or {}).items()
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+async def _asgi_stream(scope, receive, send) -> None:
+    """
+    ASGI handler for GET /stream.
+
+    Mirrors `require_auth` + `stream_interaction`, but awaits the provider streams on
+    the event loop and runs the DB setup in a worker thread, so no worker is pinned for
+    the lifetime of a response. A client that disconnects is noticed at once, even
+    between frames, and only unsubscribes; the generation keeps running for a grace
+    period in case it reconnects, and is cancelled after that.
+    """
+    headers = {
+        k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]
+    }
+    args = MultiDict(
+        urllib.parse.parse_qsl(scope["query_string"].decode(), keep_blank_values=True)
+    )
+    token = _extract_token(headers.get("authorization"), args)
+    if not token:
+        await _asgi_send_json(send, 401, {'error': 'No token provided'})
+        return
+    payload = verify_token(token)
+    if not payload:
+        await _asgi_send_json(send, 401, {'error': 'Invalid or expired token'})
+        return
+
+    user_id = payload['user_id']
+    resume = _parse_last_event_id(
+        headers.get("last-event-id") or args.get("lastEventId")
+    )
+    ctx = None
+    if resume is None:
+        stream_args = _parse_stream_args(args)
+        try:
+            await ADMISSION.acquire_async(user_id, _estimate_stream_tokens(stream_args))
+        except AdmissionRejected as e:
+            await _asgi_send_json(send, 429, {'error': str(e)}, _admission_headers(e))
+            return
+        try:
+            ctx = await asyncio.to_thread(_prepare_stream, stream_args, user_id)
+        finally:
+            if ctx is None:
+                ADMISSION.release(user_id)
+        if ctx is not None:
+            generation = await _start_generation(
+                ctx, stream_args["llm_choices"], user_id
+            )
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"access-control-allow-origin", b"*"),
+            ],
+        }
+    )
+    if resume is None and ctx is None:
+        error_data = _sse({"error": "Failed to prepare conversation"})
+        await send({"type": "http.response.body", "body": error_data.encode()})
+        return
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def forward(agen):
+        async with contextlib.aclosing(agen):
+            async for frame in agen:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": frame.encode(),
+                        "more_body": True,
+                    }
+                )
+
+    if resume is not None:
+        agen = _follow_resumed_generation(resume, user_id)
+    else:
+        agen = generation.subscribe()
+    # Forward frames in their own task so a disconnect interrupts a stalled stream
+    # (slow first token, long reasoning) rather than waiting for the next frame.
+    watcher = asyncio.create_task(watch_disconnect())
+    forwarder = asyncio.create_task(forward(agen))
+    try:
+        await asyncio.wait({watcher, forwarder}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        forwarder.cancel()
+        await asyncio.gather(watcher, forwarder, return_exceptions=True)
+    if not watcher.cancelled():
+        print("Client disconnected from /stream")
+        return
+    forwarder.result()
+    await send({"type": "http.response.body", "body": b""})
+
+
+_WSGI_FALLBACK = a2wsgi.WSGIMiddleware(
+    APP, workers=int(environ.get('WSGI_THREADS', '10'))
+)
+
+
+async def ASGI_APP(scope, receive, send) -> None:
+    """
+    ASGI entrypoint: /stream runs natively on the event loop, everything else (short
+    JSON endpoints and static files) is handed to the Flask app in a thread pool.
+    """
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(TOKEN_REVOCATIONS.start)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if (
+        scope["type"] == "http"
+        and scope["path"] == "/stream"
+        and scope["method"] == "GET"
+    ):
+        await _asgi_stream(scope, receive, send)
+        return
+    await _WSGI_FALLBACK(scope, receive, send)
+
+
 if __name__ == '__main__':
     APP.run(port=5005, debug=True)
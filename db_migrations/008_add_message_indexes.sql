@@ -0,0 +1,7 @@
+-- Index messages for per-conversation history loads (ordered by sent_at) and for
+-- walking branch trees through parent_message_id
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_sent_at
+  ON messages(conversation_id, sent_at);
+
+CREATE INDEX IF NOT EXISTS idx_messages_parent_message_id
+  ON messages(parent_message_id);
\ No newline at end of file
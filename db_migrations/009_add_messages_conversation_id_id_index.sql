@@ -0,0 +1,4 @@
+-- Index messages by (conversation_id, id) so max(id) per conversation, used to check
+-- whether a cached conversation tree is still current, is a single index probe
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_id
+  ON messages(conversation_id, id);
\ No newline at end of file
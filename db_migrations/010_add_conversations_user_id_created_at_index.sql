@@ -0,0 +1,3 @@
+-- Index conversations for the sidebar's keyset-paginated, newest-first listing
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_created_at
+  ON conversations(user_id, created_at DESC, id DESC);
\ No newline at end of file
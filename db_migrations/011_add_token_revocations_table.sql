@@ -0,0 +1,12 @@
+-- Revoked JWTs: one token (jti) or, with jti NULL, every token of user_id issued
+-- before revoked_at. Rows can be deleted once expires_at has passed.
+CREATE TABLE IF NOT EXISTS token_revocations (
+    id SERIAL PRIMARY KEY,
+    jti VARCHAR(64) NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_token_revocations_expires_at
+  ON token_revocations(expires_at);
\ No newline at end of file
@@ -0,0 +1,4 @@
+-- Record why an assistant reply ended early: 'cancelled' when the user stopped it or
+-- the client went away. NULL for replies that ran to completion.
+ALTER TABLE messages
+ADD COLUMN IF NOT EXISTS finish_reason VARCHAR(20) NULL;
\ No newline at end of file
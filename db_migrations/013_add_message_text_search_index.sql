@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Full-text search over message text for GET /api/search. An expression GIN index
+-- serves the backend's to_tsvector('english', message_text) @@ matches. Unlike a
+-- stored tsvector column, it doesn't rewrite the table, and CONCURRENTLY builds it
+-- without blocking writes (hence no transaction). The expression, including the
+-- 'english' configuration, must match the backend's query exactly to be used. If a
+-- build is interrupted, drop the invalid index and run the migration again.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_message_text_fts
+  ON messages USING GIN (to_tsvector('english', message_text));
\ No newline at end of file
@@ -0,0 +1,5 @@
+-- Track when a conversation was created or last renamed, so GET /api/conversations
+-- can validate its ETag from (count, max(updated_at)) without reading the list.
+-- now() is evaluated once, so existing rows get it without a table rewrite.
+ALTER TABLE conversations
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
\ No newline at end of file
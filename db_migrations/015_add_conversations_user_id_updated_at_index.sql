@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Index conversations by (user_id, updated_at) so the conversation list's version
+-- check, count(*) and max(updated_at) per user, is an index-only scan.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversations_user_id_updated_at
+  ON conversations(user_id, updated_at);
\ No newline at end of file
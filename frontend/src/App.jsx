@@ -22,6 +22,9 @@ import api from "./api";
 
 import { API_ENDPOINTS } from "./constants";
 
+// Reconnects attempted for a dropped /stream before reporting the connection lost.
+const MAX_STREAM_RECONNECTS = 3;
+
 // Format a default conversation title using the user's local time, matching the
 // backend's style (e.g., "October 29, 2025, 9:37 AM").
 const formatLocalDefaultTitle = () => {
@@ -44,7 +47,13 @@ const AppContent = () => {
   const [editState, setEditState] = useState({ id: null, text: "" });
   const [isDeleteMode, setIsDeleteMode] = useState(false);
   const eventSourceRef = useRef(null);
+  // ID of the generation behind the open stream, used to stop it.
+  const [generationId, setGenerationId] = useState(null);
   const messagesEndRef = useRef(null);
+  // Message to scroll into view after opening a search hit, as { messageId }, and the
+  // last target already scrolled to.
+  const [scrollTarget, setScrollTarget] = useState(null);
+  const handledScrollRef = useRef(null);
 
   const {
     currentConversation,
@@ -68,8 +77,17 @@ const AppContent = () => {
     setTimeout(() => setLoginHighlight(false), 500);
   };
 
-  // Scroll to the end of the chat when new messages arrive.
+  // Scroll to the end of the chat when new messages arrive, or to a search hit once
+  // its message is rendered.
   useEffect(() => {
+    if (scrollTarget && handledScrollRef.current !== scrollTarget) {
+      const node = document.getElementById(`message-${scrollTarget.messageId}`);
+      if (node) {
+        handledScrollRef.current = scrollTarget;
+        node.scrollIntoView({ behavior: "smooth", block: "center" });
+        return;
+      }
+    }
     // If the anchor div for messagesEndRef exists, scroll it into view to smoothly
     // bring the latest message into view at the bottom of the chat.
     if (messagesEndRef.current) {
@@ -78,7 +96,7 @@ const AppContent = () => {
         block: "end",
       });
     }
-  }, [currentConversation.messages]);
+  }, [currentConversation.messages, scrollTarget]);
 
   // Show loading state while verifying authentication token on app startup
   // This prevents UI flicker and ensures proper authentication state
@@ -119,6 +137,7 @@ const AppContent = () => {
 
     setCurrentUserInput("");
     setIsStreaming(true);
+    setGenerationId(null);
 
     if (eventSourceRef.current) {
       eventSourceRef.current.close();
@@ -159,8 +178,13 @@ const AppContent = () => {
       currentConversation.id != null ? selectedParentId : null;
     let assistantParentId = null;
 
+    // Dropped connections are retried by EventSource itself, which sends the last
+    // event id so the backend resumes the same generation. Give up after a few tries.
+    let reconnectAttempts = 0;
+
     es.onmessage = (evt) => {
       console.log("Received SSE event:", evt.data);
+      reconnectAttempts = 0;
       // Handle incoming Server-Sent Events: parse the JSON payload and route it through
       // the appropriate update flows (errors, new conversation, assignment of message
       // IDs, or streaming tokens) inside this try block.
@@ -183,6 +207,44 @@ const AppContent = () => {
           return;
         }
 
+        if (parsed.generation_id) {
+          setGenerationId(parsed.generation_id);
+          return;
+        }
+        // The fallback model answered instead of the one selected (see
+        // fallback_models in shared/models.json).
+        if (parsed.answered_by) {
+          setCurrentConversation((prev) => {
+            const newMessages = [...prev.messages];
+            if (
+              assistantMessageIndex !== -1 &&
+              newMessages[assistantMessageIndex]
+            ) {
+              newMessages[assistantMessageIndex] = {
+                ...newMessages[assistantMessageIndex],
+                llm_model: parsed.answered_by,
+              };
+            }
+            return { ...prev, messages: newMessages };
+          });
+          return;
+        }
+        if (parsed.cancelled) {
+          setCurrentConversation((prev) => {
+            const newMessages = [...prev.messages];
+            if (
+              assistantMessageIndex !== -1 &&
+              newMessages[assistantMessageIndex]
+            ) {
+              newMessages[assistantMessageIndex] = {
+                ...newMessages[assistantMessageIndex],
+                finish_reason: "cancelled",
+              };
+            }
+            return { ...prev, messages: newMessages };
+          });
+          return;
+        }
         if (parsed.new_conversation_id) {
           const newId = parsed.new_conversation_id;
           console.log("Received new conversation ID:", newId);
@@ -312,15 +374,38 @@ const AppContent = () => {
       es.close();
       eventSourceRef.current = null;
       setIsStreaming(false);
+      setGenerationId(null);
       console.log(`SSE connection closed${isError ? " due to error" : ""}.`);
     };
 
     // Close SSE connection on error and display a system message.
     es.onerror = (evt) => {
-      // If the connection is already closed, this is likely a normal completion, not an
-      // error
+      // The browser only gives up on its own (CLOSED) when the server refused the
+      // stream outright, e.g. 429 from per-user admission control. Closing after
+      // completion goes through handleClose and never reaches here.
       if (es.readyState === EventSource.CLOSED) {
-        console.log("SSE connection closed normally.");
+        console.error("SSE stream refused by the server", evt);
+        handleClose(true);
+        setCurrentConversation((prev) => ({
+          ...prev,
+          messages: [
+            ...prev.messages,
+            {
+              text:
+                "Error: The server refused this request. Too many responses may " +
+                "be running; try again shortly.",
+              sender: "system",
+            },
+          ],
+        }));
+        return;
+      }
+      if (
+        es.readyState === EventSource.CONNECTING &&
+        reconnectAttempts < MAX_STREAM_RECONNECTS
+      ) {
+        reconnectAttempts += 1;
+        console.warn(`SSE connection lost; reconnecting (${reconnectAttempts})`);
         return;
       }
       console.error("SSE error: connection lost", evt);
@@ -335,6 +420,29 @@ const AppContent = () => {
     };
   };
 
+  // Stop the running generation. The stream stays open to receive the saved partial
+  // reply's ID and the completion event.
+  const handleStop = async () => {
+    if (!generationId) {
+      return;
+    }
+    try {
+      await api.cancelGeneration(generationId);
+    } catch (error) {
+      console.error("Error stopping generation:", error);
+      setCurrentConversation((prev) => ({
+        ...prev,
+        messages: [
+          ...prev.messages,
+          {
+            text: "Error: The response could not be stopped; it may have finished.",
+            sender: "system",
+          },
+        ],
+      }));
+    }
+  };
+
   // Update conversation topic and refresh the conversation list.
   const handleEditConversation = async (id, newTopic) => {
     try {
@@ -376,6 +484,22 @@ const AppContent = () => {
     loadConversationMessages(conversationId);
   };
 
+  // Open a search hit: load its conversation (unless already open) with the message
+  // selected, then scroll the tree to it.
+  const handleSearchResultSelected = async (conversationId, messageId) => {
+    if (conversationId === currentConversation.id) {
+      setSelectedParentId(messageId);
+    } else {
+      if (eventSourceRef.current) {
+        eventSourceRef.current.close();
+        setIsStreaming(false);
+      }
+      await loadConversationMessages(conversationId, messageId);
+    }
+    // A fresh object each time, so picking the same hit again scrolls again.
+    setScrollTarget({ messageId });
+  };
+
   return (
     <>
       <div className="header-material">
@@ -401,7 +525,10 @@ const AppContent = () => {
           )}
         </div>
       </div>
-      <StreamingIndicator isVisible={isStreaming} />
+      <StreamingIndicator
+        isVisible={isStreaming}
+        onStop={generationId ? handleStop : null}
+      />
       <div className="app-container">
         <ConversationPanel
           editState={editState}
@@ -411,6 +538,7 @@ const AppContent = () => {
           isDeleteMode={isDeleteMode}
           onDeleteConversation={handleDeleteConversation}
           onNewConversation={handleNewConversation}
+          onOpenSearchResult={handleSearchResultSelected}
         />
         <InteractionArea
           onSubmit={handleSubmit}
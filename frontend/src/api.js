@@ -23,6 +23,47 @@ const api = {
     return response.json();
   },
 
+  /**
+   * Fetch only the messages added to a conversation after the message `sinceId`.
+   * Resolves to { messages, last_id, reset }; when `reset` is true, `messages` is the
+   * full list and replaces whatever the caller had cached.
+   */
+  async fetchMessagesSince(conversationId, sinceId) {
+    const token = localStorage.getItem("auth_token");
+    const response = await fetch(
+      `${API_ENDPOINTS.MESSAGES}/${conversationId}?since=${sinceId}`,
+      {
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+      }
+    );
+    if (!response.ok) {
+      throw new Error(`Failed to fetch messages (${response.status})`);
+    }
+    return response.json();
+  },
+
+  /**
+   * Full-text search over the current user's messages, best match first.
+   * Resolves to { results, nextCursor }; pass `nextCursor` back to get the next page
+   * (it is null on the last one). Each result carries `conversation_id` and
+   * `message_id` plus an HTML `snippet` whose matches are wrapped in <mark>.
+   */
+  async searchMessages(query, cursor = null) {
+    const token = localStorage.getItem("auth_token");
+    const params = new URLSearchParams({ q: query });
+    if (cursor) params.set("cursor", cursor);
+    const response = await fetch(`${API_ENDPOINTS.SEARCH}?${params}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    });
+    if (!response.ok) {
+      throw new Error(`Search failed (${response.status})`);
+    }
+    return {
+      results: await response.json(),
+      nextCursor: response.headers.get("X-Next-Cursor"),
+    };
+  },
+
   async updateConversationTopic(id, topic) {
     const token = localStorage.getItem("auth_token");
     const response = await fetch(`${API_ENDPOINTS.CONVERSATIONS}/${id}`, {
@@ -51,6 +92,26 @@ const api = {
     return response.json();
   },
 
+  /**
+   * Stop a running generation. The backend saves what was streamed so far, marked
+   * as cancelled, and the open /stream connection receives its closing events.
+   * Rejects when the server has no such running generation (404).
+   */
+  async cancelGeneration(generationId) {
+    const token = localStorage.getItem("auth_token");
+    const response = await fetch(
+      `${API_ENDPOINTS.GENERATIONS}/${generationId}/cancel`,
+      {
+        method: "POST",
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+      }
+    );
+    if (!response.ok) {
+      throw new Error(`Failed to stop generation (${response.status})`);
+    }
+    return response.json();
+  },
+
   /**
    * Get the current user's API keys.
    */
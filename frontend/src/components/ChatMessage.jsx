@@ -17,7 +17,7 @@ const ChatMessage = ({
   collapsed,
   onToggleCollapse = () => {},
 }) => {
-  const { text = "", sender, llm_model } = message;
+  const { text = "", sender, llm_model, finish_reason } = message;
   const lines = text.split(/\r?\n/);
   // Maximum number of lines to display before collapse toggle appears
   const COLLAPSE_THRESHOLD = 4;
@@ -82,7 +82,10 @@ const ChatMessage = ({
   return (
     <div className={messageClass}>
       {sender === "assistant" && llm_model && (
-        <div className="model-badge">{llm_model}</div>
+        <div className="model-badge">
+          {llm_model}
+          {finish_reason === "cancelled" && " (stopped)"}
+        </div>
       )}
       <div
         className="message-content"
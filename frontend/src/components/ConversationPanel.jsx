@@ -1,10 +1,14 @@
 /**
  * ConversationPanel.jsx
  *
- * Displays a list of past conversations and enables editing of titles.
+ * Displays a list of past conversations and enables editing of titles. While a
+ * search is typed, the list is replaced by matching messages.
  */
+import { useState } from "react";
 import ConversationItem from "./ConversationItem";
+import ConversationSearch from "./ConversationSearch";
 import { useConversation } from "../contexts/ConversationContext";
+import { useAuth } from "../contexts/AuthContext";
 import "./ConversationPanel.css";
 
 const ConversationPanel = ({
@@ -24,8 +28,14 @@ const ConversationPanel = ({
   isDeleteMode,
   // Trigger starting a brand new conversation
   onNewConversation,
+  // `onOpenSearchResult` is a callback to open a search hit - receives conversation ID
+  // and message ID from parent
+  onOpenSearchResult,
 }) => {
   const { conversations } = useConversation();
+  const { isAuthenticated } = useAuth();
+  const [searchQuery, setSearchQuery] = useState("");
+  const isSearching = isAuthenticated && searchQuery.trim() !== "";
 
   // Enter edit mode for a conversation title on double click.
   const handleDoubleClick = (conv) => {
@@ -46,13 +56,22 @@ const ConversationPanel = ({
           New Conversation
         </button>
       </div>
-      <div className="panel-header">
-        <div className="past-chats-label">
-          {isDeleteMode ? "Delete Conversations" : "Past Conversations"}
+      {isAuthenticated && (
+        <ConversationSearch
+          query={searchQuery}
+          onQueryChange={setSearchQuery}
+          onOpenResult={onOpenSearchResult}
+        />
+      )}
+      {!isSearching && (
+        <div className="panel-header">
+          <div className="past-chats-label">
+            {isDeleteMode ? "Delete Conversations" : "Past Conversations"}
+          </div>
         </div>
-      </div>
+      )}
       {/* Render each conversation as a list item. */}
-      {conversations?.map((conv) => (
+      {!isSearching && conversations?.map((conv) => (
         <ConversationItem
           key={conv.id}
           conversation={conv}
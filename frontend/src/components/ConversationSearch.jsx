@@ -0,0 +1,128 @@
+/**
+ * ConversationSearch.jsx
+ *
+ * Search box for the conversation panel. Runs a full-text search over the user's
+ * messages as they type and lists the hits, best match first, with highlighted
+ * snippets. Picking a hit opens its conversation with that message selected.
+ */
+import { useEffect, useRef, useState } from "react";
+import api from "../api";
+import "./ConversationSearch.css";
+
+// Wait this long after the last keystroke before searching.
+const SEARCH_DEBOUNCE_MS = 300;
+
+const ConversationSearch = ({
+  query,
+  // `onQueryChange` is a callback to update the search text - receives the new text
+  // from this component
+  onQueryChange,
+  // `onOpenResult` is a callback to open a hit - receives its conversation ID and
+  // message ID from this component
+  onOpenResult,
+}) => {
+  const [results, setResults] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoading, setIsLoading] = useState(false);
+  const [error, setError] = useState(null);
+  // Incremented per search so responses to an outdated query are dropped.
+  const searchIdRef = useRef(0);
+
+  const trimmed = query.trim();
+
+  // Search again (from the first page) once typing pauses.
+  useEffect(() => {
+    const searchId = ++searchIdRef.current;
+    setResults([]);
+    setNextCursor(null);
+    setError(null);
+    if (!trimmed) {
+      setIsLoading(false);
+      return;
+    }
+    setIsLoading(true);
+    const timer = setTimeout(async () => {
+      try {
+        const page = await api.searchMessages(trimmed);
+        if (searchId !== searchIdRef.current) return;
+        setResults(page.results);
+        setNextCursor(page.nextCursor);
+      } catch (err) {
+        if (searchId !== searchIdRef.current) return;
+        console.error("Error searching messages:", err);
+        setError("Search failed");
+      } finally {
+        if (searchId === searchIdRef.current) setIsLoading(false);
+      }
+    }, SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [trimmed]);
+
+  // Append the next page of hits for the current query.
+  const handleLoadMore = async () => {
+    const searchId = searchIdRef.current;
+    setIsLoading(true);
+    try {
+      const page = await api.searchMessages(trimmed, nextCursor);
+      if (searchId !== searchIdRef.current) return;
+      setResults((prev) => [...prev, ...page.results]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      if (searchId !== searchIdRef.current) return;
+      console.error("Error loading more search results:", err);
+      setError("Search failed");
+    } finally {
+      if (searchId === searchIdRef.current) setIsLoading(false);
+    }
+  };
+
+  return (
+    <div className="conversation-search">
+      <div className="search-input-row">
+        <input
+          type="search"
+          className="search-input"
+          placeholder="Search messages"
+          value={query}
+          onChange={(e) => onQueryChange(e.target.value)}
+          onKeyDown={(e) => {
+            if (e.key === "Escape") onQueryChange("");
+          }}
+        />
+      </div>
+      {trimmed && (
+        <div className="search-results">
+          {error && <div className="search-status search-error">{error}</div>}
+          {!error && !isLoading && results.length === 0 && (
+            <div className="search-status">No matching messages</div>
+          )}
+          {results.map((hit) => (
+            <div
+              key={hit.message_id}
+              className="search-result"
+              onClick={() => onOpenResult(hit.conversation_id, hit.message_id)}
+            >
+              <div className="search-result-topic">{hit.conversation_topic}</div>
+              {/* The server HTML-escapes snippets and only adds <mark> tags. */}
+              <div
+                className="search-result-snippet"
+                dangerouslySetInnerHTML={{ __html: hit.snippet }}
+              />
+              <div className="search-result-meta">
+                {hit.sender === "assistant" ? hit.llm_model || "assistant" : "you"}
+              </div>
+            </div>
+          ))}
+          {isLoading && <div className="search-status">Searching…</div>}
+          {!isLoading && nextCursor && (
+            <button className="search-more-button" onClick={handleLoadMore}>
+              More results
+            </button>
+          )}
+        </div>
+      )}
+    </div>
+  );
+};
+
+export default ConversationSearch;
@@ -6,7 +6,7 @@
 import { useEffect, useRef, useState } from "react";
 import ChatMessage from "./ChatMessage";
 import { useConversation } from "../contexts/ConversationContext";
-import { OPENAI_MODELS, ANTHROPIC_MODELS } from "../constants";
+import { MODEL_PROVIDERS } from "../constants";
 import { useAuth } from "../contexts/AuthContext";
 import "./InteractionArea.css";
 
@@ -97,6 +97,7 @@ const InteractionArea = ({
       nodes.push(
         <div
           key={msg.key || msg.id}
+          id={msg.id != null ? `message-${msg.id}` : undefined}
           className={`message-node ${isSelected ? "selected-node" : ""} ${
             isAncestor ? "ancestor-node" : ""
           }`}
@@ -271,59 +272,45 @@ const InteractionArea = ({
                 role="listbox"
                 style={{ maxHeight: `${menuMaxHeight}px` }}
               >
-                <div className="llm-group" role="group" aria-label="OpenAI">
-                  <div className="llm-group-label">
-                    OpenAI{user?.openai_api_key ? "" : " (API key missing)"}
-                  </div>
-                  {OPENAI_MODELS.map((model) => {
-                    const isDisabled = !user?.openai_api_key;
-                    const isSelected = selectedLLM === model;
+                {MODEL_PROVIDERS.filter((provider) => provider.models.length).map(
+                  (provider) => {
+                    const isDisabled =
+                      provider.userApiKey !== null && !user?.[provider.userApiKey];
                     return (
-                      <button
-                        type="button"
-                        key={model}
-                        className={`llm-option${isSelected ? " selected" : ""}`}
-                        onClick={() => {
-                          if (isDisabled) return;
-                          setSelectedLLM(model);
-                          setIsDropdownOpen(false);
-                        }}
-                        disabled={isDisabled}
-                        role="option"
-                        aria-selected={isSelected}
+                      <div
+                        className="llm-group"
+                        role="group"
+                        aria-label={provider.label}
+                        key={provider.name}
                       >
-                        {model}
-                      </button>
+                        <div className="llm-group-label">
+                          {provider.label}
+                          {isDisabled ? " (API key missing)" : ""}
+                        </div>
+                        {provider.models.map((model) => {
+                          const isSelected = selectedLLM === model;
+                          return (
+                            <button
+                              type="button"
+                              key={model}
+                              className={`llm-option${isSelected ? " selected" : ""}`}
+                              onClick={() => {
+                                if (isDisabled) return;
+                                setSelectedLLM(model);
+                                setIsDropdownOpen(false);
+                              }}
+                              disabled={isDisabled}
+                              role="option"
+                              aria-selected={isSelected}
+                            >
+                              {model}
+                            </button>
+                          );
+                        })}
+                      </div>
                     );
-                  })}
-                </div>
-                <div className="llm-group" role="group" aria-label="Anthropic">
-                  <div className="llm-group-label">
-                    Anthropic
-                    {user?.anthropic_api_key ? "" : " (API key missing)"}
-                  </div>
-                  {ANTHROPIC_MODELS.map((model) => {
-                    const isDisabled = !user?.anthropic_api_key;
-                    const isSelected = selectedLLM === model;
-                    return (
-                      <button
-                        type="button"
-                        key={model}
-                        className={`llm-option${isSelected ? " selected" : ""}`}
-                        onClick={() => {
-                          if (isDisabled) return;
-                          setSelectedLLM(model);
-                          setIsDropdownOpen(false);
-                        }}
-                        disabled={isDisabled}
-                        role="option"
-                        aria-selected={isSelected}
-                      >
-                        {model}
-                      </button>
-                    );
-                  })}
-                </div>
+                  }
+                )}
               </div>
             )}
           </div>
@@ -6,14 +6,15 @@ import "./SettingsPage.css";
 /**
  * SettingsPage
  *
- * Allows users to view and update their OpenAI and Anthropic API keys.
+ * Allows users to view and update their OpenAI and Anthropic API keys, and to log out
+ * of every session.
  */
 const SettingsPage = ({ onClose }) => {
   const [openaiKey, setOpenaiKey] = useState("");
   const [anthropicKey, setAnthropicKey] = useState("");
   const [saving, setSaving] = useState(false);
   const [error, setError] = useState(null);
-  const { fetchCurrentUser } = useAuth();
+  const { fetchCurrentUser, logoutEverywhere } = useAuth();
 
   useEffect(() => {
     async function loadKeys() {
@@ -78,6 +79,9 @@ const SettingsPage = ({ onClose }) => {
         <button onClick={onClose} disabled={saving}>
           Cancel
         </button>
+        <button onClick={logoutEverywhere} disabled={saving}>
+          Log out everywhere
+        </button>
       </div>
     </div>
   );
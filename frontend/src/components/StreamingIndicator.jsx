@@ -4,11 +4,21 @@ import './StreamingIndicator.css';
 /**
  * StreamingIndicator.jsx
  *
- * Displays a small text indicator in the header when an LLM response is streaming.
+ * Displays a small text indicator in the header when an LLM response is streaming,
+ * with a button to stop it once the backend has reported the generation ID.
  */
-const StreamingIndicator = ({ isVisible }) => {
+const StreamingIndicator = ({ isVisible, onStop }) => {
   if (!isVisible) return null;
-  return <div className="streaming-indicator">Response streaming...</div>;
+  return (
+    <div className="streaming-indicator">
+      Response streaming...
+      {onStop && (
+        <button className="stop-button" onClick={onStop}>
+          Stop
+        </button>
+      )}
+    </div>
+  );
 };
 
 export default StreamingIndicator;
\ No newline at end of file
@@ -2,7 +2,8 @@
  * Application-wide constants and model configuration.
  *
  * API_ENDPOINTS holds the REST API base URLs.
- * OPENAI_MODELS, ANTHROPIC_MODELS, and REASONING_MODELS are lists loaded from shared/models.json.
+ * MODEL_PROVIDERS, OPENAI_MODELS, ANTHROPIC_MODELS, and REASONING_MODELS are derived from
+ * the providers in shared/models.json.
  * Note: REASONING_MODELS is used by the backend to determine temperature settings.
  */
 import modelConfig from "../../shared/models.json";
@@ -21,18 +22,36 @@ const API_ROOT = import.meta.env.DEV ? "/api" : "api"; // NOTE: no leading "/" i
 export const API_ENDPOINTS = {
   CONVERSATIONS: `${ORIGIN}${API_ROOT}/conversations`,
   MESSAGES: `${ORIGIN}${API_ROOT}/messages`,
+  GENERATIONS: `${ORIGIN}${API_ROOT}/generations`,
+  SEARCH: `${ORIGIN}${API_ROOT}/search`,
   AUTH: {
     LOGIN: `${ORIGIN}${API_ROOT}/auth/login`,
     REGISTER: `${ORIGIN}${API_ROOT}/auth/register`,
     ME: `${ORIGIN}${API_ROOT}/auth/me`,
     KEYS: `${ORIGIN}${API_ROOT}/auth/keys`,
+    LOGOUT: `${ORIGIN}${API_ROOT}/auth/logout`,
+    LOGOUT_ALL: `${ORIGIN}${API_ROOT}/auth/logout-all`,
   },
   // SSE endpoint (absolute in dev, relative in prod):
   STREAM: import.meta.env.DEV ? `${ORIGIN}/stream` : "stream",
 };
 
-export const OPENAI_MODELS = modelConfig.openai_models;
+// One model picker group per provider. `userApiKey` names the user field that must be
+// set before its models can be picked; providers without one (local servers) are
+// always available.
+export const MODEL_PROVIDERS = Object.entries(modelConfig.providers).map(
+  ([name, provider]) => ({
+    name,
+    label: provider.label ?? name,
+    models: provider.models ?? [],
+    userApiKey: provider.user_api_key ?? null,
+  })
+);
 
-export const ANTHROPIC_MODELS = modelConfig.anthropic_models;
+export const OPENAI_MODELS = modelConfig.providers.openai.models;
 
-export const REASONING_MODELS = modelConfig.reasoning_models;
+export const ANTHROPIC_MODELS = modelConfig.providers.anthropic.models;
+
+export const REASONING_MODELS = Object.values(modelConfig.providers).flatMap(
+  (provider) => provider.reasoning_models ?? []
+);
@@ -130,13 +130,34 @@ export const AuthProvider = ({ children }) => {
   };
 
   /**
-   * logout: remove authentication token and clear user state.
+   * POST the stored token to a revocation endpoint, then forget it. Local state is
+   * cleared first and regardless of the response, so logging out works offline.
    */
-  const logout = () => {
+  const revokeAndClear = async (endpoint) => {
+    const token = localStorage.getItem("auth_token");
     localStorage.removeItem("auth_token");
     setUser(null);
+    if (!token) return;
+    try {
+      await fetch(endpoint, {
+        method: "POST",
+        headers: { Authorization: `Bearer ${token}` },
+      });
+    } catch (error) {
+      console.error("Token revocation failed:", error);
+    }
   };
 
+  /**
+   * logout: revoke this session's token and clear user state.
+   */
+  const logout = () => revokeAndClear(API_ENDPOINTS.AUTH.LOGOUT);
+
+  /**
+   * logoutEverywhere: revoke every session of this user, then clear user state.
+   */
+  const logoutEverywhere = () => revokeAndClear(API_ENDPOINTS.AUTH.LOGOUT_ALL);
+
   /**
    * Fetch current user info (including updated API keys) from the backend.
    */
@@ -171,6 +192,7 @@ export const AuthProvider = ({ children }) => {
     login,
     register,
     logout,
+    logoutEverywhere,
     fetchCurrentUser,
     isAuthenticated: !!user,
     isAdmin: user?.is_admin || false,
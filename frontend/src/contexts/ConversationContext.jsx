@@ -8,7 +8,9 @@
  * - currentUserInput: text for the next user message.
  * - selectedLLM: the chosen language model identifier.
  *
- * Exposes functions to fetch conversations and messages from the backend.
+ * Exposes functions to fetch conversations and messages from the backend. Message lists
+ * already fetched are kept per conversation, so re-opening a conversation only asks the
+ * backend for messages newer than the last one seen.
  */
 import {
   createContext,
@@ -16,6 +18,7 @@ import {
   useContext,
   useEffect,
   useCallback,
+  useRef,
 } from "react";
 import api from "../api";
 import { OPENAI_MODELS } from "../constants";
@@ -48,6 +51,9 @@ export const ConversationProvider = ({ children }) => {
   const [selectedLLM, setSelectedLLM] = useState("");
   // Optional parent message ID if replying to a specific message.
   const [selectedParentId, setSelectedParentId] = useState(null);
+  // Full message lists (including system messages) already fetched, keyed by
+  // conversation ID. Not state: changes here never need a re-render by themselves.
+  const messageCacheRef = useRef(new Map());
 
   // Fetch the list of conversations from the backend API.
   const fetchConversations = useCallback(async () => {
@@ -67,6 +73,7 @@ export const ConversationProvider = ({ children }) => {
       fetchConversations();
     } else {
       setConversations([]);
+      messageCacheRef.current.clear();
       setCurrentConversation({ id: null, messages: [], systemMessage: "" });
       setCurrentUserInput("");
       setSelectedParentId(null);
@@ -74,42 +81,69 @@ export const ConversationProvider = ({ children }) => {
   }, [isAuthenticated, fetchConversations]);
 
   /**
-   * Load messages for a given conversation ID.
-   * If no ID is provided, reset to an empty conversation state.
+   * Return every message of a conversation, fetching only the delta since the last
+   * cached message when this conversation has been loaded before.
    */
-  const loadConversationMessages = useCallback(async (conversationId) => {
-    if (!conversationId) {
-      setCurrentConversation({ id: null, messages: [], systemMessage: "" });
-      setCurrentUserInput("");
-      return;
-    }
-    try {
-      const fetchedMessages = await api.fetchMessages(conversationId);
-      // Extract system message (e.g., prompt or instructions).
-      const systemMsg =
-        fetchedMessages.find((msg) => msg.sender === "system")?.text || "";
-      // Only show user and assistant [non-system] messages in the UI.
-      const displayMessages = fetchedMessages.filter(
-        (msg) => msg.sender !== "system"
-      );
-
-      setCurrentConversation({
-        id: conversationId,
-        messages: displayMessages,
-        systemMessage: systemMsg,
-      });
-      setSelectedParentId(null);
-      setCurrentUserInput("");
-    } catch (error) {
-      console.error(
-        `Error fetching messages for conversation ${conversationId}:`,
-        error
-      );
-      setCurrentConversation({ id: null, messages: [], systemMessage: "" });
-      setCurrentUserInput("");
+  const fetchAllMessages = useCallback(async (conversationId) => {
+    const cache = messageCacheRef.current;
+    const cached = cache.get(conversationId);
+    let messages;
+    if (cached && cached.length > 0) {
+      const lastId = Math.max(...cached.map((msg) => msg.id));
+      const delta = await api.fetchMessagesSince(conversationId, lastId);
+      messages = delta.reset ? delta.messages : [...cached, ...delta.messages];
+    } else {
+      messages = await api.fetchMessages(conversationId);
+      if (!Array.isArray(messages)) {
+        throw new Error(messages.error || "Unexpected messages response");
+      }
     }
+    cache.set(conversationId, messages);
+    return messages;
   }, []);
 
+  /**
+   * Load messages for a given conversation ID, optionally selecting one of them (e.g.
+   * a search hit) as the reply parent.
+   * If no ID is provided, reset to an empty conversation state.
+   */
+  const loadConversationMessages = useCallback(
+    async (conversationId, selectMessageId = null) => {
+      if (!conversationId) {
+        setCurrentConversation({ id: null, messages: [], systemMessage: "" });
+        setCurrentUserInput("");
+        return;
+      }
+      try {
+        const fetchedMessages = await fetchAllMessages(conversationId);
+        // Extract system message (e.g., prompt or instructions).
+        const systemMsg =
+          fetchedMessages.find((msg) => msg.sender === "system")?.text || "";
+        // Only show user and assistant [non-system] messages in the UI.
+        const displayMessages = fetchedMessages.filter(
+          (msg) => msg.sender !== "system"
+        );
+
+        setCurrentConversation({
+          id: conversationId,
+          messages: displayMessages,
+          systemMessage: systemMsg,
+        });
+        setSelectedParentId(selectMessageId);
+        setCurrentUserInput("");
+      } catch (error) {
+        console.error(
+          `Error fetching messages for conversation ${conversationId}:`,
+          error
+        );
+        messageCacheRef.current.delete(conversationId);
+        setCurrentConversation({ id: null, messages: [], systemMessage: "" });
+        setCurrentUserInput("");
+      }
+    },
+    [fetchAllMessages]
+  );
+
   return (
     <ConversationContext.Provider
       value={{
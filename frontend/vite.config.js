@@ -1,9 +1,46 @@
+import fs from "node:fs";
+import path from "node:path";
+import zlib from "node:zlib";
 import { defineConfig } from "vite";
 import react from "@vitejs/plugin-react";
 
+const outDir = path.resolve(__dirname, "../dist");
+
+// Write .br and .gz siblings for text assets so the backend can serve them without
+// compressing on every request. Files smaller than this are not worth it.
+const COMPRESSIBLE = /\.(js|mjs|css|html|svg|json|txt|map|wasm)$/;
+const MIN_COMPRESS_BYTES = 1024;
+
+function precompress() {
+  return {
+    name: "precompress",
+    apply: "build",
+    closeBundle() {
+      const walk = (dir) =>
+        fs.readdirSync(dir, { withFileTypes: true }).flatMap((entry) => {
+          const full = path.join(dir, entry.name);
+          return entry.isDirectory() ? walk(full) : [full];
+        });
+
+      for (const file of walk(outDir)) {
+        if (!COMPRESSIBLE.test(file)) continue;
+        const source = fs.readFileSync(file);
+        if (source.length < MIN_COMPRESS_BYTES) continue;
+        fs.writeFileSync(
+          `${file}.br`,
+          zlib.brotliCompressSync(source, {
+            params: { [zlib.constants.BROTLI_PARAM_QUALITY]: 11 },
+          })
+        );
+        fs.writeFileSync(`${file}.gz`, zlib.gzipSync(source, { level: 9 }));
+      }
+    },
+  };
+}
+
 export default defineConfig({
   base: "",
-  plugins: [react()],
+  plugins: [react(), precompress()],
   server: {
     port: 3000,
   },
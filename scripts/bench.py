@@ -0,0 +1,406 @@
+"""
+Load scenarios against a running backend, reporting latency percentiles and throughput.
+
+    python scripts/bench.py seed --email bench@example.com --password bench-password
+    python scripts/bench.py run --email bench@example.com --password bench-password
+
+`seed` registers (or logs in) the benchmark user and, through DATABASE_URL, gives it
+`--conversations` small conversations plus one large branched tree to load. `run` drives
+each scenario with `--concurrency` closed-loop workers for `--duration` seconds:
+
+- login: POST /api/auth/login
+- conversations: GET /api/conversations
+- messages: GET /api/messages/<id> on the seeded branched tree
+- stream: GET /stream with a fresh prompt each time, read to `stream_complete`
+
+Run /stream against scripts/fake_llm_server.py rather than the real providers. Save
+a run with `--save` and pass it back as `--baseline` to fail (exit 1) when a scenario's
+p99 or throughput regresses by more than `--tolerance`.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import httpx
+import psycopg2
+import psycopg2.extras
+
+SCENARIOS = ("login", "conversations", "messages", "stream")
+TREE_TOPIC = "Benchmark tree"
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of `values` (q in 0..100); 0.0 when empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class ScenarioResult:
+    """Latencies, errors and (for /stream) time to first token of one scenario run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: list[float] = []
+        self.ttfts: list[float] = []
+        self.output_chars = 0
+        self.errors: dict[str, int] = {}
+        self.elapsed = 0.0
+
+    def error(self, reason: str) -> None:
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def summary(self) -> dict:
+        requests = len(self.latencies) + sum(self.errors.values())
+        summary = {
+            'requests': requests,
+            'ok': len(self.latencies),
+            'errors': self.errors,
+            'throughput': len(self.latencies) / self.elapsed if self.elapsed else 0.0,
+            'p50_ms': percentile(self.latencies, 50) * 1000,
+            'p90_ms': percentile(self.latencies, 90) * 1000,
+            'p99_ms': percentile(self.latencies, 99) * 1000,
+            'max_ms': max(self.latencies, default=0.0) * 1000,
+        }
+        if self.ttfts:
+            summary['ttft_p50_ms'] = percentile(self.ttfts, 50) * 1000
+            summary['ttft_p99_ms'] = percentile(self.ttfts, 99) * 1000
+            # A rough ~4 characters per token. The backend's estimate_tokens counts
+            # words and punctuation instead, so compare this figure between runs,
+            # not with the backend's token counters.
+            summary['output_tokens_per_s'] = self.output_chars / 4 / self.elapsed
+        return summary
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> dict:
+    """Log in, registering first if needed, and return the token and user."""
+    credentials = {'email': email, 'password': password}
+    response = await client.post("/api/auth/login", json=credentials)
+    if response.status_code == 401:
+        response = await client.post("/api/auth/register", json=credentials)
+    response.raise_for_status()
+    return response.json()
+
+
+async def find_tree(client: httpx.AsyncClient, token: str) -> int:
+    response = await client.get(
+        "/api/conversations", headers={'Authorization': f"Bearer {token}"}
+    )
+    response.raise_for_status()
+    for conversation in response.json():
+        if conversation['topic'].startswith(TREE_TOPIC):
+            return conversation['id']
+    raise SystemExit("No seeded tree found; run `scripts/bench.py seed` first.")
+
+
+async def one_request(
+    scenario: str,
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    token: str,
+    tree_id: int | None,
+    result: ScenarioResult,
+    worker: int,
+    n: int,
+) -> None:
+    headers = {'Authorization': f"Bearer {token}"}
+    started = time.perf_counter()
+    try:
+        if scenario == "login":
+            response = await client.post(
+                "/api/auth/login", json={'email': args.email, 'password': args.password}
+            )
+        elif scenario == "conversations":
+            response = await client.get("/api/conversations", headers=headers)
+        elif scenario == "messages":
+            response = await client.get(f"/api/messages/{tree_id}", headers=headers)
+        else:
+            await stream_request(client, args, token, result, started, worker, n)
+            return
+        await response.aread()
+        if response.status_code != 200:
+            result.error(str(response.status_code))
+            return
+    except httpx.HTTPError as e:
+        result.error(type(e).__name__)
+        return
+    result.latencies.append(time.perf_counter() - started)
+
+
+async def stream_request(
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    token: str,
+    result: ScenarioResult,
+    started: float,
+    worker: int,
+    n: int,
+) -> None:
+    # A new prompt every time, so the response cache never answers for the provider.
+    params = {
+        'userText': f"Benchmark prompt {worker}-{n}-{random.random()}",
+        'llm': args.model,
+        'token': token,
+    }
+    ttft = None
+    chars = 0
+    async with client.stream("GET", "/stream", params=params) as response:
+        if response.status_code != 200:
+            await response.aread()
+            result.error(str(response.status_code))
+            return
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: ") :])
+            if 'token' in event:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                chars += len(event['token'])
+            elif 'error' in event:
+                result.error("stream error")
+                return
+            elif event.get('stream_complete'):
+                break
+        else:
+            result.error("incomplete stream")
+            return
+    if ttft is None:
+        result.error("empty reply")
+        return
+    result.latencies.append(time.perf_counter() - started)
+    result.ttfts.append(ttft)
+    result.output_chars += chars
+
+
+async def run_scenario(
+    scenario: str,
+    client: httpx.AsyncClient,
+    args: argparse.Namespace,
+    token: str,
+    tree_id: int | None,
+) -> ScenarioResult:
+    """Run closed-loop workers for the warmup, then measure for `args.duration`."""
+    result = ScenarioResult(scenario)
+    measuring = False
+    warmup = ScenarioResult(scenario)
+    deadline = time.perf_counter() + args.warmup + args.duration
+
+    async def worker(index: int) -> None:
+        n = 0
+        while time.perf_counter() < deadline:
+            target = result if measuring else warmup
+            await one_request(scenario, client, args, token, tree_id, target, index, n)
+            n += 1
+
+    workers = [asyncio.create_task(worker(i)) for i in range(args.concurrency)]
+    await asyncio.sleep(args.warmup)
+    measuring = True
+    measure_started = time.perf_counter()
+    await asyncio.gather(*workers)
+    result.elapsed = time.perf_counter() - measure_started
+    return result
+
+
+def print_report(summaries: dict[str, dict]) -> None:
+    header = (
+        f"{'scenario':<14}{'ok':>7}{'errors':>8}{'req/s':>9}"
+        f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, s in summaries.items():
+        print(
+            f"{name:<14}{s['ok']:>7}{sum(s['errors'].values()):>8}"
+            f"{s['throughput']:>9.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}"
+            f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}"
+        )
+        if 'ttft_p50_ms' in s:
+            print(
+                f"{'':<14}time to first token p50 {s['ttft_p50_ms']:.1f} ms, "
+                f"p99 {s['ttft_p99_ms']:.1f} ms; "
+                f"~{s['output_tokens_per_s']:.0f} output tokens/s"
+            )
+        if s['errors']:
+            print(f"{'':<14}errors: {s['errors']}")
+
+
+def compare(summaries: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions beyond `tolerance` (a fraction) against a saved run."""
+    regressions = []
+    for name, s in summaries.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base['p99_ms'] and s['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {s['p99_ms']:.1f} ms vs {base['p99_ms']:.1f} ms"
+            )
+        if s['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {s['throughput']:.1f} req/s vs {base['throughput']:.1f}"
+            )
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> int:
+    scenarios = args.scenario or list(SCENARIOS)
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=timeout
+    ) as client:
+        token = (await login(client, args.email, args.password))['token']
+        tree_id = await find_tree(client, token) if "messages" in scenarios else None
+        summaries = {}
+        for scenario in scenarios:
+            print(
+                f"Running {scenario}: {args.concurrency} workers, "
+                f"{args.warmup}s warmup + {args.duration}s",
+                file=sys.stderr,
+            )
+            result = await run_scenario(scenario, client, args, token, tree_id)
+            summaries[scenario] = result.summary()
+
+    print_report(summaries)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summaries, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summaries, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+def seed(args: argparse.Namespace) -> None:
+    """Give the benchmark user small conversations and one large branched tree."""
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        raise SystemExit("DATABASE_URL is not set in the environment.")
+
+    async def _login() -> dict:
+        async with httpx.AsyncClient(base_url=args.base_url) as client:
+            return await login(client, args.email, args.password)
+
+    user_id = asyncio.run(_login())['user']['id']
+    rng = random.Random(args.seed)
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+
+    for i in range(args.conversations):
+        cur.execute(
+            "INSERT INTO conversations (conversation_topic, user_id) "
+            "VALUES (%s, %s) RETURNING id",
+            (f"Benchmark conversation {i}", user_id),
+        )
+        conversation_id = cur.fetchone()[0]
+        parent = None
+        for turn in range(4):
+            sender = "user" if turn % 2 == 0 else "assistant"
+            cur.execute(
+                "INSERT INTO messages (conversation_id, message_text, sender_name, "
+                "parent_message_id) VALUES (%s, %s, %s, %s) RETURNING id",
+                (conversation_id, f"Message {turn}", sender, parent),
+            )
+            parent = cur.fetchone()[0]
+
+    # The tree: mostly extend the newest leaf, but branch from an earlier message
+    # `--branch-rate` of the time, the way regenerating and editing build trees.
+    cur.execute(
+        "INSERT INTO conversations (conversation_topic, user_id) "
+        "VALUES (%s, %s) RETURNING id",
+        (f"{TREE_TOPIC} ({args.tree_messages} messages)", user_id),
+    )
+    tree_id = cur.fetchone()[0]
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('messages', 'id')) "
+        "FROM generate_series(1, %s)",
+        (args.tree_messages,),
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    rows = []
+    for i, message_id in enumerate(ids):
+        if i == 0:
+            parent = None
+        elif rng.random() < args.branch_rate:
+            parent = ids[rng.randrange(i)]
+        else:
+            parent = ids[i - 1]
+        sender = "user" if i % 2 == 0 else "assistant"
+        text = " ".join(
+            rng.choice(("lorem", "ipsum", "dolor", "sit", "amet"))
+            for _ in range(rng.randint(20, 200))
+        )
+        rows.append((message_id, tree_id, text, sender, parent))
+    psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO messages (id, conversation_id, message_text, sender_name, "
+        "parent_message_id) VALUES %s",
+        rows,
+        page_size=1000,
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(
+        f"Seeded user {user_id}: {args.conversations} conversations and tree "
+        f"{tree_id} with {args.tree_messages} messages."
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--base-url", default="http://127.0.0.1:5005")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="bench-password")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="create the benchmark data")
+    seed_parser.add_argument("--conversations", type=int, default=200)
+    seed_parser.add_argument("--tree-messages", type=int, default=2000)
+    seed_parser.add_argument("--branch-rate", type=float, default=0.2)
+    seed_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser("run", help="run the load scenarios")
+    run_parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="scenario to run; repeat for several (default: all)",
+    )
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--duration", type=float, default=30.0)
+    run_parser.add_argument("--warmup", type=float, default=5.0)
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--model", default="gpt-4.1-2025-04-14")
+    run_parser.add_argument("--save", help="write the results as JSON to this file")
+    run_parser.add_argument("--baseline", help="results JSON to compare against")
+    run_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed p99/throughput regression against --baseline (default 0.2)",
+    )
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    else:
+        sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
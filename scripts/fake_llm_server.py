@@ -0,0 +1,312 @@
+"""
+Local stand-in for the OpenAI and Anthropic streaming APIs, for load tests.
+
+Serves `POST /v1/chat/completions` (OpenAI) and `POST /v1/messages` (Anthropic) as
+Server-Sent Events in each provider's wire format, with a configurable time to first
+token, token rate and error injection. Point the backend at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8100
+
+Both SDKs read those variables, including for the per-user clients. Any API key is
+accepted. Only the standard library is used so it can run next to the backend
+without extra dependencies.
+"""
+
+import argparse
+import http.server
+import itertools
+import json
+import random
+import signal
+import threading
+import time
+import uuid
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while branching conversations keep "
+    "every reply so that nothing is lost and each answer can be compared"
+).split()
+
+
+class FakeProviderHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 with chunked bodies so the SDKs keep their connections alive, as they
+    # would against the real APIs.
+    protocol_version = "HTTP/1.1"
+    server: "FakeProviderServer"
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            provider = "openai"
+        elif self.path.rstrip("/").endswith("/messages"):
+            provider = "anthropic"
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        options = self.server.options
+        rng = self.server.rng()
+        self.server.count("requests")
+        if rng.random() < options.error_rate:
+            self.server.count("errors")
+            self._send_error(provider, options.error_status)
+            return
+
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or 1024
+        reply_tokens = max(1, min(max_tokens, options.reply_tokens))
+        drop_after = (
+            rng.randrange(1, reply_tokens + 1)
+            if rng.random() < options.drop_rate
+            else None
+        )
+        ttft = max(0.0, rng.gauss(options.ttft, options.ttft_jitter))
+        tokens = [
+            " " + WORDS[i % len(WORDS)] if i else WORDS[0] for i in range(reply_tokens)
+        ]
+        model = body.get("model", "fake-model")
+        input_tokens = max(1, length // 4)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        if provider == "openai":
+            frames = _openai_frames(model, tokens)
+        else:
+            frames = _anthropic_frames(model, tokens, input_tokens)
+
+        try:
+            time.sleep(ttft)
+            interval = 1.0 / options.tokens_per_second
+            sent = 0
+            for frame, is_token in frames:
+                if is_token:
+                    if sent:
+                        time.sleep(interval)
+                    sent += 1
+                    if drop_after is not None and sent > drop_after:
+                        # Cut the connection without the terminating chunk, like a
+                        # provider or proxy dying mid-reply.
+                        self.server.count("dropped")
+                        self.close_connection = True
+                        return
+                self._write_chunk(frame.encode())
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+            self.server.count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # The backend closed the stream (client went away or was cancelled).
+            self.server.count("aborted")
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, provider: str, status: int) -> None:
+        message = f"Injected error ({status})"
+        if provider == "anthropic":
+            kind = {429: "rate_limit_error", 529: "overloaded_error"}.get(
+                status, "api_error"
+            )
+            self._send_json(
+                status, {"type": "error", "error": {"type": kind, "message": message}}
+            )
+        else:
+            kind = "rate_limit_exceeded" if status == 429 else "server_error"
+            self._send_json(
+                status,
+                {
+                    "error": {
+                        "message": message,
+                        "type": kind,
+                        "param": None,
+                        "code": None,
+                    }
+                },
+            )
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _openai_frames(model: str, tokens: list[str]):
+    """Yield (frame, is_token) pairs of a chat.completion.chunk stream."""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return _sse(
+            {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+        )
+
+    yield chunk({"role": "assistant", "content": ""}), False
+    for token in tokens:
+        yield chunk({"content": token}), True
+    yield chunk({}, "stop"), False
+    yield "data: [DONE]\n\n", False
+
+
+def _anthropic_frames(model: str, tokens: list[str], input_tokens: int):
+    """Yield (frame, is_token) pairs of a Messages API event stream."""
+    message = {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "content": [],
+        "model": model,
+        "stop_reason": None,
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": 1},
+    }
+    yield _sse({"type": "message_start", "message": message}, "message_start"), False
+    yield _sse(
+        {
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        },
+        "content_block_start",
+    ), False
+    for token in tokens:
+        yield _sse(
+            {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": token},
+            },
+            "content_block_delta",
+        ), True
+    yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop"), False
+    yield _sse(
+        {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(tokens)},
+        },
+        "message_delta",
+    ), False
+    yield _sse({"type": "message_stop"}, "message_stop"), False
+
+
+class FakeProviderServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, options: argparse.Namespace):
+        super().__init__(address, FakeProviderHandler)
+        self.options = options
+        self.counters = dict.fromkeys(
+            ("requests", "errors", "dropped", "aborted", "completed"), 0
+        )
+        self._lock = threading.Lock()
+        self._seeds = itertools.count(options.seed)
+
+    def rng(self) -> random.Random:
+        """A per-request RNG, so runs with the same --seed inject the same faults."""
+        with self._lock:
+            return random.Random(next(self._seeds))
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--ttft", type=float, default=0.3, help="mean seconds to first token"
+    )
+    parser.add_argument(
+        "--ttft-jitter",
+        type=float,
+        default=0.1,
+        help="standard deviation of the time to first token, in seconds",
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=50, help="output rate per stream"
+    )
+    parser.add_argument(
+        "--reply-tokens",
+        type=int,
+        default=200,
+        help="tokens per reply, capped by the request's max tokens",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests answered with --error-status instead of a stream",
+    )
+    parser.add_argument(
+        "--error-status",
+        type=int,
+        default=500,
+        help="status of injected errors, e.g. 429, 500 or 529",
+    )
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        default=0.0,
+        help="fraction of streams whose connection is cut partway through",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    options = parser.parse_args()
+    if options.tokens_per_second <= 0:
+        parser.error("--tokens-per-second must be positive")
+
+    server = FakeProviderServer((options.host, options.port), options)
+    # Stop cleanly (and print the counters) when a benchmark script kills us too.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(
+        f"Fake OpenAI/Anthropic server on http://{options.host}:{options.port} "
+        f"(ttft {options.ttft}s, {options.tokens_per_second} tok/s, "
+        f"{options.reply_tokens} tokens, error rate {options.error_rate}, "
+        f"drop rate {options.drop_rate})"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.counters}")
+
+
+if __name__ == "__main__":
+    main()
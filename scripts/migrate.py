@@ -27,6 +27,10 @@ cur.execute(
 conn.commit()
 
 
+# Files starting with this line run outside a transaction, for statements that can't
+# run inside one (e.g. CREATE INDEX CONCURRENTLY). Keep them to a single statement.
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
 # Apply migrations in order
 migration_files = sorted(migrations_dir.glob('*.sql'))
 applied_count = 0
@@ -37,7 +41,16 @@ for file in migration_files:
     already_applied = cur.fetchone() is not None
     if not already_applied:
         with open(file, 'r') as f:
-            cur.execute(f.read())
+            sql = f.read()
+        if sql.startswith(NO_TRANSACTION_MARKER):
+            conn.commit()  # end the transaction the check above opened
+            conn.autocommit = True
+            try:
+                cur.execute(sql)
+            finally:
+                conn.autocommit = False
+        else:
+            cur.execute(sql)
         cur.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (filename,))
         conn.commit()
         print(f"Applied {filename}")